@@ -0,0 +1,111 @@
+"""Bulk import/export benchmark.
+
+Streams a generated catalog (courses, lessons and a quiz for every few lessons)
+as NDJSON into POST /import in-process against a temporary SQLite database,
+then reads it back through the export stream, printing the time, rate and
+peak memory growth of each step.
+
+    python benchmarks/bench_import.py --lessons 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ["atom", "force", "energy", "cell", "river", "market", "poem", "vector", "climate", "theorem", "empire",
+         "enzyme", "orbit", "ledger", "syntax", "harmony", "glacier", "protein", "circuit", "fable"]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def catalog(args, rng: random.Random):
+    """Yield the NDJSON upload in chunks, generated on the fly"""
+    def sentence(count):
+        return " ".join(rng.choices(WORDS, k=count))
+
+    lines = []
+    for course in range(1, args.courses + 1):
+        lines.append({"type": "course", "id": f"c{course}", "title": f"Course {course}", "description": sentence(12)})
+    for lesson in range(1, args.lessons + 1):
+        lines.append({"type": "lesson", "id": lesson, "course": f"c{rng.randint(1, args.courses)}",
+                      "title": sentence(4), "content": sentence(args.words)})
+        if lesson % args.quiz_every == 0:
+            lines.append({"type": "quiz", "lesson": lesson, "questions": [
+                {"question": f"{sentence(6)}?", "options": [f"{letter}) {sentence(2)}" for letter in "ABCD"],
+                 "answer": "A) ..."}
+                for _ in range(3)
+            ]})
+        if len(lines) >= 1000:
+            yield "".join(json.dumps(line) + "\n" for line in lines).encode()
+            lines = []
+    if lines:
+        yield "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+
+async def run(args):
+    import httpx
+    import main
+    from db.migrations import run_migrations
+
+    run_migrations(main.engine)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": "bench"})
+        token = (await client.post("/auth/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+
+        rss = peak_rss_mb()
+        start = time.perf_counter()
+        response = await client.post("/import", content=catalog(args, random.Random(args.seed)), headers={
+            "Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson",
+        })
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        summary = response.json()
+        print(f"import  {elapsed:6.1f}s  {args.lessons / elapsed:8.0f} lessons/s  "
+              f"peak RSS +{peak_rss_mb() - rss:.0f} MB  "
+              f"courses {summary['courses']} lessons {summary['lessons']} quizzes {summary['quizzes']} "
+              f"errors {summary['error_count']}")
+
+    # httpx's ASGITransport buffers whole responses, so read the export's stream directly
+    from service import catalog_transfer
+
+    rss = peak_rss_mb()
+    start = time.perf_counter()
+    lines = size = 0
+    for chunk in catalog_transfer.export_lines():
+        lines += chunk.count(b"\n")
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"export  {elapsed:6.1f}s  {lines / elapsed:8.0f} lines/s    "
+          f"peak RSS +{peak_rss_mb() - rss:.0f} MB  {lines} lines, {size / 1e6:.0f} MB")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lessons", type=int, default=100_000)
+    parser.add_argument("--courses", type=int, default=500)
+    parser.add_argument("--words", type=int, default=120, help="words per lesson")
+    parser.add_argument("--quiz-every", type=int, default=5, help="one quiz per this many lessons")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["URL_DATABASE"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,88 @@
+"""Login storm benchmark.
+
+Runs the app in-process against a temporary SQLite database, fires a burst of
+concurrent logins and, at the same time, a steady stream of GET /courses/
+requests. Prints p50/p95/p99 latency for both, so the effect of password
+hashing on unrelated requests is visible.
+
+    python benchmarks/bench_login.py --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"n": len(ordered), "p50_ms": round(pick(0.50), 1), "p95_ms": round(pick(0.95), 1),
+            "p99_ms": round(pick(0.99), 1), "mean_ms": round(statistics.mean(ordered) * 1000, 1)}
+
+
+async def run(args):
+    import httpx
+    import main
+    from db.migrations import run_migrations
+
+    run_migrations(main.engine)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/auth/register", json={"username": "bench", "email": "b@x.io", "password": "secret"})
+        await client.post("/courses/", json={"title": "bench", "description": "bench"})
+
+        login_latencies, read_latencies, statuses = [], [], {}
+        semaphore = asyncio.Semaphore(args.concurrency)
+        storm_done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/auth/login", data={"username": "bench", "password": "secret"})
+                login_latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def reader():
+            while not storm_done.is_set():
+                start = time.perf_counter()
+                await client.get("/courses/")
+                read_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(args.read_interval)
+
+        readers = [asyncio.create_task(reader()) for _ in range(args.readers)]
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - start
+        storm_done.set()
+        await asyncio.gather(*readers)
+
+    print(f"logins: {args.logins} in {elapsed:.2f}s, status codes {statuses}")
+    print("login latency   ", percentiles(login_latencies))
+    print("non-auth latency", percentiles(read_latencies))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--read-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["URL_DATABASE"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "bench")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
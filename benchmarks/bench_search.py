@@ -0,0 +1,110 @@
+"""Search latency benchmark.
+
+Fills a temporary SQLite database with generated courses and lessons (indexed
+by the FTS5 triggers), then runs GET /search in-process for a mix of rare,
+common and multi-word queries and prints p50/p95/p99 latency per query kind.
+
+    python benchmarks/bench_search.py --lessons 100000
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_login import percentiles  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "tes", "vo", "nul", "pri", "shi", "dor", "en", "qua", "bel", "zin", "tor"]
+
+
+def vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def populate(engine, args, rng: random.Random):
+    from sqlalchemy import insert
+    from db import models
+
+    words = vocabulary(args.vocabulary, rng)
+    # Zipf-like weights so a few words are very common and most are rare
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+    def sentence(count):
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=count))
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Course), [
+            {"id": id, "title": f"Course {id} {sentence(3)}", "description": sentence(20)}
+            for id in range(1, args.courses + 1)
+        ])
+        batch = []
+        for id in range(1, args.lessons + 1):
+            batch.append({"id": id, "title": sentence(4), "content": sentence(args.words),
+                          "course_id": rng.randint(1, args.courses)})
+            if len(batch) == 5000:
+                conn.execute(insert(models.Lesson), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(models.Lesson), batch)
+    return words
+
+
+async def run(args):
+    import httpx
+    import main
+    from db.migrations import run_migrations
+
+    run_migrations(main.engine)
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    words = populate(main.engine, args, rng)
+    print(f"indexed {args.courses} courses and {args.lessons} lessons in {time.perf_counter() - start:.1f}s")
+
+    queries = {
+        "rare": lambda: rng.choice(words[len(words) // 2:]),
+        "common": lambda: rng.choice(words[:10]),
+        "two-words": lambda: f"{rng.choice(words[:200])} {rng.choice(words[:200])}",
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for kind, make_query in queries.items():
+            latencies, hits = [], 0
+            for _ in range(args.queries):
+                query = make_query()
+                started = time.perf_counter()
+                response = await client.get("/search", params={"q": query, "limit": args.limit})
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                hits += len(response.json())
+            print(f"{kind:<10}", percentiles(latencies), f"avg results {hits / args.queries:.1f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lessons", type=int, default=100_000)
+    parser.add_argument("--courses", type=int, default=500)
+    parser.add_argument("--words", type=int, default=120, help="words per lesson")
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200, help="queries per kind")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["URL_DATABASE"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "bench")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_cli()
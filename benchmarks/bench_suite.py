@@ -0,0 +1,202 @@
+"""Load-test benchmark suite.
+
+Runs the app in-process (with its lifespan) against a temporary SQLite database
+and the fake quiz provider, then drives each scenario with a fixed number of
+concurrent clients, after an unmeasured warm-up round that fills the caches. For
+every scenario it prints throughput, p50/p95/p99 latency, the error count and
+the median number of SQL statements a request ran (counted per request, so
+background work such as job workers and the attempt writer is left out).
+
+Results can be saved as a baseline and later runs compared against it; the
+comparison fails when p95 latency grows by more than --tolerance or a scenario
+issues more SQL statements per request than before. Baselines are only
+comparable on the same machine.
+
+    python benchmarks/bench_suite.py --save-baseline
+    python benchmarks/bench_suite.py --compare
+    python benchmarks/bench_suite.py --scenario quiz_generate --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_login import percentiles  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+LESSON_TEXT = ("Photosynthesis converts light energy into chemical energy. "
+               "Chlorophyll absorbs mostly blue and red light. ") * 4
+
+
+class Scenario:
+    """A named request, issued `requests` times by `concurrency` clients"""
+
+    def __init__(self, name, request, requests=200, concurrency=None):
+        self.name = name
+        self.request = request
+        self.requests = requests
+        self.concurrency = concurrency
+
+
+async def setup(client):
+    """Create the user, course, lessons and quiz the scenarios work on"""
+    await client.post("/auth/register", json={"username": "bench", "email": "bench@x.io", "password": "secret"})
+    token = (await client.post("/auth/login", data={"username": "bench", "password": "secret"})).json()["access_token"]
+    course = (await client.post("/courses/", json={"title": "Bench course", "description": "Plants"})).json()
+    lessons = []
+    for i in range(20):
+        lesson = await client.post(f"/courses/{course['id']}/lessons",
+                                   json={"title": f"Lesson {i}", "content": f"{LESSON_TEXT} Part {i}."})
+        lessons.append(lesson.json()["id"])
+    quiz = (await client.post("/quiz/generate", params={"lesson_id": lessons[0]})).json()
+    return {"headers": {"Authorization": f"Bearer {token}"}, "course_id": course["id"], "lessons": lessons,
+            "quiz": quiz, "answers": [question["answer"] for question in quiz["questions"]]}
+
+
+def scenarios(state):
+    headers, lessons, quiz = state["headers"], state["lessons"], state["quiz"]
+    counter = iter(range(10 ** 9))
+
+    return [
+        Scenario("auth_login", lambda c: c.post("/auth/login", data={"username": "bench", "password": "secret"}),
+                 requests=20),
+        Scenario("auth_me", lambda c: c.get("/auth/users/me/", headers=headers)),
+        Scenario("course_list", lambda c: c.get("/courses/")),
+        Scenario("course_create", lambda c: c.post("/courses/", json={"title": f"Course {next(counter)}",
+                                                                      "description": "Generated"})),
+        Scenario("lesson_list", lambda c: c.get(f"/courses/{state['course_id']}/lessons")),
+        Scenario("lesson_read", lambda c: c.get(f"/lessons/{lessons[next(counter) % len(lessons)]}")),
+        Scenario("lesson_create", lambda c: c.post(f"/courses/{state['course_id']}/lessons",
+                                                   json={"title": "New", "content": f"Fresh {next(counter)}"})),
+        Scenario("search", lambda c: c.get("/search", params={"q": "chlorophyll light"})),
+        Scenario("quiz_read", lambda c: c.get(f"/quiz/{quiz['id']}")),
+        Scenario("quiz_generate_cached", lambda c: c.post("/quiz/generate", params={"lesson_id": lessons[0]})),
+        Scenario("quiz_generate", lambda c: c.post(
+            "/quiz/generate", params={"lesson_id": lessons[next(counter) % len(lessons)], "force_regenerate": True}
+        ), requests=100),
+        Scenario("attempt_submit", lambda c: c.post(f"/quiz/{quiz['id']}/attempts",
+                                                    json={"answers": state["answers"]}, headers=headers)),
+    ]
+
+
+async def run_scenario(client, scenario, concurrency, warmup):
+    from db.query_counter import count_queries
+
+    concurrency = scenario.concurrency or concurrency
+    latencies, statements, errors = [], [], 0
+
+    async def worker(remaining):
+        nonlocal errors
+        for _ in remaining:
+            # Each worker is its own task, so the counter only sees this request's statements
+            with count_queries() as counter:
+                start = time.perf_counter()
+                response = await scenario.request(client)
+                latencies.append(time.perf_counter() - start)
+            statements.append(counter.count)
+            if response.status_code >= 400:
+                errors += 1
+
+    remaining = iter(range(min(warmup, scenario.requests)))
+    await asyncio.gather(*(worker(remaining) for _ in range(concurrency)))
+    latencies, statements, errors = [], [], 0
+
+    remaining = iter(range(scenario.requests))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(remaining) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {**percentiles(latencies), "throughput_rps": round(len(latencies) / elapsed, 1), "errors": errors,
+            "statements_per_request": sorted(statements)[len(statements) // 2] if statements else 0}
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance) and result["p95_ms"] - before["p95_ms"] > 1:
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if result["statements_per_request"] > before["statements_per_request"]:
+            regressions.append(f"{name}: SQL statements per request "
+                               f"{before['statements_per_request']} -> {result['statements_per_request']}")
+    return regressions
+
+
+async def run(args):
+    import httpx
+    import main
+    from db.migrations import run_migrations
+    from service import providers
+    from service.fake_provider import FakeProvider
+
+    run_migrations(main.engine)
+    providers.set_provider(FakeProvider(first_chunk_delay=args.provider_latency, chunk_delay=0,
+                                        error_rate=args.provider_error_rate, seed=1))
+
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            state = await setup(client)
+            for scenario in scenarios(state):
+                if args.scenario and scenario.name not in args.scenario:
+                    continue
+                if args.requests:
+                    scenario.requests = args.requests
+                results[scenario.name] = await run_scenario(client, scenario, args.concurrency, args.warmup)
+                result = results[scenario.name]
+                print(f"{scenario.name:<22} {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']:>7} ms  "
+                      f"p95 {result['p95_ms']:>7} ms  p99 {result['p99_ms']:>7} ms  "
+                      f"errors {result['errors']:>3}  sql/req {result['statements_per_request']}")
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", help="run only these scenarios (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, help="requests per scenario, overriding the defaults")
+    parser.add_argument("--warmup", type=int, default=32, help="unmeasured requests per scenario")
+    parser.add_argument("--provider-latency", type=float, default=0.05, help="fake provider latency in seconds")
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative p95 growth")
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["URL_DATABASE"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ["QUIZ_PROVIDER"] = "fake"
+    # Keep admission control in the path but out of the way, unless the caller sets real limits
+    for name, value in (("LLM_MAX_CONCURRENT", "256"), ("LLM_MAX_CONCURRENT_PER_CALLER", "256"),
+                        ("LLM_REQUESTS_PER_MINUTE", "1000000"), ("LLM_REQUEST_BURST", "10000")):
+        os.environ.setdefault(name, value)
+    results = asyncio.run(run(args))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main_cli()
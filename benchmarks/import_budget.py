@@ -0,0 +1,65 @@
+"""Import-time budget check.
+
+Imports the app in a fresh interpreter with `-X importtime`, prints the slowest
+modules by cumulative time and exits non-zero when importing `main` exceeds the
+budget or pulls in a module that must stay lazy (the Gemini SDK and grpc stack).
+
+    python benchmarks/import_budget.py --budget-ms 2000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed when a quiz is generated; see GeminiProvider in service/providers.py
+LAZY_MODULES = ("google.generativeai", "google.ai.generativelanguage", "google.api_core.exceptions", "grpc")
+
+
+def import_times(module: str):
+    """Return {module: (self_us, cumulative_us)} for one cold import of `module`"""
+    env = {**os.environ, "URL_DATABASE": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'import.db')}",
+           "SECRET_KEY": os.environ.get("SECRET_KEY", "import-budget")}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "2000")))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total_ms = times[args.module][1] / 1000
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"importing {args.module} took {total_ms:.0f} ms, budget is {args.budget_ms:.0f} ms")
+    eager = [name for name in LAZY_MODULES if name in times]
+    if eager:
+        failures.append(f"imported at startup but should be lazy: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: {args.module} imports in {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
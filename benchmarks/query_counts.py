@@ -0,0 +1,116 @@
+"""SQL statement count check for the list and detail endpoints.
+
+Fills a temporary SQLite database at two sizes and counts the statements each
+endpoint runs (db.query_counter) with the HTTP cache cleared before every
+request. Exits non-zero when a count changes with the number of rows, i.e. when
+an endpoint issues a query per listed item.
+
+    python benchmarks/query_counts.py --small 3 --large 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUESTION = {"question": "What do plants absorb?", "options": ["Light", "Sound", "Heat", "Noise"], "answer": "Light"}
+
+
+def grow(size: int):
+    """Add courses, lessons (in course 1) and quizzes until there are `size` of each"""
+    from sqlalchemy import func, select
+    from db import models, quiz_store
+    from db.database import SessionLocal
+
+    with SessionLocal() as db:
+        for _ in range(size - db.scalar(select(func.count()).select_from(models.Course))):
+            db.add(models.Course(title=f"Course {os.urandom(4).hex()}", description="Plants"))
+        db.flush()
+        lessons = []
+        for i in range(size - db.scalar(select(func.count()).select_from(models.Lesson))):
+            lesson = models.Lesson(title=f"Lesson {i}", content=f"Photosynthesis part {i}.", course_id=1)
+            db.add(lesson)
+            lessons.append(lesson)
+        db.flush()
+        quiz_store.add_quizzes(db, [{"lesson_id": lesson.id, "content_hash": f"hash-{lesson.id}",
+                                     "questions": [QUESTION]} for lesson in lessons])
+        db.commit()
+
+
+def endpoints(size: int):
+    return {
+        "course_list": f"/courses/?limit={size}",
+        "course_detail": "/courses/1",
+        "course_lessons": f"/courses/1/lessons?limit={size}",
+        "lesson_list": f"/lessons/?limit={size}",
+        "lesson_detail": "/lessons/1",
+        "quiz_detail": "/quiz/1",
+    }
+
+
+async def measure(client, headers, size: int):
+    from db.query_counter import count_queries
+    from service import http_cache
+
+    counts = {}
+    for name, url in endpoints(size).items():
+        http_cache.invalidate_prefix("")
+        with count_queries() as counter:
+            response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        counts[name] = counter.count
+    return counts
+
+
+async def run(args):
+    import httpx
+    import main
+    from db.migrations import run_migrations
+
+    run_migrations(main.engine)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            await client.post("/auth/register", json={"username": "check", "email": "check@x.io", "password": "secret"})
+            token = (await client.post("/auth/login", data={"username": "check", "password": "secret"})).json()
+            headers = {"Authorization": f"Bearer {token['access_token']}"}
+            for size in (args.small, args.large):
+                grow(size)
+                # Warm the per-process caches outside the HTTP cache (e.g. the authenticated user)
+                await measure(client, headers, size)
+                results[size] = await measure(client, headers, size)
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--small", type=int, default=3)
+    parser.add_argument("--large", type=int, default=30)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "query_counts.db")
+    os.environ["URL_DATABASE"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "query-counts")
+    results = asyncio.run(run(args))
+
+    small, large = results[args.small], results[args.large]
+    print(f"{'endpoint':<16} {f'N={args.small}':>6} {f'N={args.large}':>6}")
+    failures = []
+    for name in small:
+        print(f"{name:<16} {small[name]:>6} {large[name]:>6}")
+        if small[name] != large[name]:
+            failures.append(f"{name} runs {small[name]} statements for {args.small} rows "
+                            f"but {large[name]} for {args.large}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: statement counts do not depend on the number of rows")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,31 @@
+"""Multi-row INSERTs that report the new ids in input order.
+
+SQLAlchemy can only promise RETURNING rows in parameter order where the dialect
+supports it (PostgreSQL); on SQLite `sort_by_parameter_order=True` silently
+falls back to one INSERT per row. There the ids are fetched unordered and
+sorted instead: SQLite assigns rowids in VALUES order, and since the batch runs
+in one write transaction no other connection can insert in between.
+
+`dialect_insert` gives the dialect's own INSERT construct, for upserts
+(`on_conflict_do_update` / `on_conflict_do_nothing`).
+"""
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def dialect_insert(bind, model):
+    """An INSERT into the model's table that supports the dialect's ON CONFLICT clauses"""
+    return _DIALECT_INSERTS[bind.dialect.name](model)
+
+
+def insert_ids(db: Session, model, rows: list) -> list:
+    """Insert `rows` into the model's table and return their new ids in the same order"""
+    if not rows:
+        return []
+    table = model.__table__
+    if db.bind.dialect.name == "sqlite":
+        return sorted(db.scalars(insert(table).returning(table.c.id), rows))
+    return list(db.scalars(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows))
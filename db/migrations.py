@@ -0,0 +1,144 @@
+"""Idempotent schema migrations.
+
+`create_all` only creates missing tables, so changes to existing tables are
+applied here as named steps recorded in `schema_migrations`.
+
+The app does not touch the schema when it starts; run `python -m db.migrations`
+(the Procfile release step) before starting it, or set RUN_MIGRATIONS_ON_STARTUP.
+"""
+import json
+
+from sqlalchemy import bindparam, inspect, insert, select, text, update
+from sqlalchemy.engine import Connection
+
+from db import models, quiz_store
+from db.database import engine
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(conn).get_columns(table))
+
+
+def _quiz_content_hash(conn: Connection):
+    if not _has_column(conn, "quizzes", "content_hash"):
+        conn.execute(text("ALTER TABLE quizzes ADD COLUMN content_hash VARCHAR(64)"))
+    for index in models.Quiz.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _quiz_job_question_count(conn: Connection):
+    if not _has_column(conn, "quiz_jobs", "question_count"):
+        conn.execute(text("ALTER TABLE quiz_jobs ADD COLUMN question_count INTEGER"))
+
+
+def _lesson_course_index(conn: Connection):
+    for index in models.Lesson.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _quiz_questions(conn: Connection, batch_size: int = 500):
+    """Backfill the pre-serialized payload and normalized question rows of existing quizzes"""
+    if not _has_column(conn, "quizzes", "questions_payload"):
+        conn.execute(text("ALTER TABLE quizzes ADD COLUMN questions_payload TEXT"))
+
+    quizzes = models.Quiz.__table__
+    last_id = 0
+    while True:
+        batch = conn.execute(
+            select(quizzes.c.id, quizzes.c.questions)
+            .where(quizzes.c.id > last_id, quizzes.c.questions_payload.is_(None))
+            .order_by(quizzes.c.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        payloads, question_rows = [], []
+        for quiz_id, questions in batch:
+            if isinstance(questions, str):
+                questions = json.loads(questions)
+            payloads.append({"quiz_id": quiz_id, "payload": quiz_store.serialize_questions(questions)})
+            question_rows.extend(quiz_store.question_rows(quiz_id, questions))
+        conn.execute(
+            update(quizzes).where(quizzes.c.id == bindparam("quiz_id")).values(questions_payload=bindparam("payload")),
+            payloads,
+        )
+        if question_rows:
+            conn.execute(insert(models.QuizQuestion.__table__), question_rows)
+        last_id = batch[-1][0]
+
+
+_POSTGRES_SEARCH_VECTORS = {
+    "courses": "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+               "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+    "lessons": "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+               "setweight(to_tsvector('english', coalesce(content, '')), 'B')",
+}
+
+_SQLITE_FTS_COLUMNS = {"courses": ("title", "description"), "lessons": ("title", "content")}
+
+
+def _search_index(conn: Connection):
+    """Full-text indexes for GET /search, maintained by the database on every write"""
+    if conn.dialect.name == "postgresql":
+        for table, vector in _POSTGRES_SEARCH_VECTORS.items():
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({vector}) STORED"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"))
+    elif conn.dialect.name == "sqlite":
+        for table, columns in _SQLITE_FTS_COLUMNS.items():
+            fts = f"{table}_fts"
+            names = ", ".join(columns)
+            new = ", ".join(f"new.{column}" for column in columns)
+            old = ", ".join(f"old.{column}" for column in columns)
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+                f"content_rowid='id', tokenize='porter unicode61')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END"
+            ))
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+MIGRATIONS = [
+    ("0001_quiz_content_hash", _quiz_content_hash),
+    ("0002_quiz_job_question_count", _quiz_job_question_count),
+    ("0003_lesson_course_index", _lesson_course_index),
+    ("0004_quiz_questions", _quiz_questions),
+    ("0005_search_index", _search_index),
+]
+
+
+def pending(applied) -> list:
+    """Names of the migrations not in `applied`"""
+    return [name for name, _ in MIGRATIONS if name not in applied]
+
+
+def run_migrations(bind=engine) -> list:
+    """Create missing tables and apply pending migrations, returning the names applied"""
+    models.Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        applied = set(conn.scalars(select(models.SchemaMigration.name)))
+        steps = dict(MIGRATIONS)
+        names = pending(applied)
+        for name in names:
+            steps[name](conn)
+            conn.execute(models.SchemaMigration.__table__.insert().values(name=name))
+    return names
+
+
+if __name__ == "__main__":
+    applied = run_migrations()
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied)}" if applied else "Schema is up to date")
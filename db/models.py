@@ -1,6 +1,7 @@
 from pydantic import EmailStr
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime, Float, Index, func, select
+from sqlalchemy.orm import query_expression, relationship, with_expression
 from sqlalchemy.dialects.postgresql import JSON
 from db.database import Base
 
@@ -30,10 +31,16 @@ class Lesson(Base):
     title = Column(String, nullable=False)
     content = Column(String, nullable=False)
     course_id = Column(Integer, ForeignKey("courses.id"))
+    # Latest quiz id, only populated when loaded with `with_quiz_id()`
+    quiz_id = query_expression()
 
     course = relationship("Course", back_populates="lessons")
     quizzes = relationship("Quiz", back_populates="lesson")
 
+    __table_args__ = (
+        Index("ix_lessons_course_id_id", "course_id", "id"),
+    )
+
 
 class Quiz(Base):
     __tablename__ = "quizzes"
@@ -41,5 +48,168 @@ class Quiz(Base):
     id = Column(Integer, primary_key=True, index=True)
     lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
     questions = Column(JSON, nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    # `questions` serialized once at write time, served as-is by reads
+    questions_payload = Column(Text, nullable=True)
 
     lesson = relationship("Lesson", back_populates="quizzes")
+    question_rows = relationship("QuizQuestion", order_by="QuizQuestion.position", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_quizzes_lesson_id_content_hash", "lesson_id", "content_hash"),
+    )
+
+
+class QuizQuestion(Base):
+    __tablename__ = "quiz_questions"
+
+    id = Column(Integer, primary_key=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    question = Column(Text, nullable=False)
+    question_hash = Column(String(64), nullable=False)
+    options = Column(JSON, nullable=False)
+    answer = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_quiz_questions_quiz_id_position", "quiz_id", "position", unique=True),
+        Index("ix_quiz_questions_question_hash", "question_hash"),
+    )
+
+
+def latest_quiz_id():
+    """Correlated subquery returning the newest quiz id of the enclosing lesson row"""
+    return select(func.max(Quiz.id)).where(Quiz.lesson_id == Lesson.id).correlate(Lesson).scalar_subquery()
+
+
+def with_quiz_id():
+    """Loader option filling `Lesson.quiz_id` in the same SELECT as the lessons"""
+    return with_expression(Lesson.quiz_id, latest_quiz_id())
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+class QuizCacheEntry(Base):
+    __tablename__ = "quiz_cache"
+
+    content_hash = Column(String(64), primary_key=True)
+    questions = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
+
+
+class QuizJob(Base):
+    __tablename__ = "quiz_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
+    force_regenerate = Column(Boolean, default=False, nullable=False)
+    question_count = Column(Integer, nullable=True)
+    status = Column(String, default="pending", nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(String, nullable=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False)
+
+    quiz = relationship("Quiz")
+
+
+class QuizAttempt(Base):
+    __tablename__ = "quiz_attempts"
+
+    id = Column(Integer, primary_key=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    answers = Column(JSON, nullable=False)
+    correct = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)
+    submitted_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_quiz_attempts_quiz_id_id", "quiz_id", "id"),
+        Index("ix_quiz_attempts_user_id_id", "user_id", "id"),
+    )
+
+
+# Aggregates over quiz_attempts, incremented as attempts are written so reads never scan attempts
+
+class QuizAttemptStats(Base):
+    __tablename__ = "quiz_attempt_stats"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+
+
+class QuizScoreBucket(Base):
+    __tablename__ = "quiz_score_buckets"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), primary_key=True)
+    # Score rounded down to a multiple of 10 percent, 0 to 10
+    bucket = Column(Integer, primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+class QuizQuestionStats(Base):
+    __tablename__ = "quiz_question_stats"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    answered = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+
+
+class UserAttemptStats(Base):
+    __tablename__ = "user_attempt_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    last_attempt_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class GenerationLease(Base):
+    __tablename__ = "generation_leases"
+
+    key = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+# Shared state of the outbound model call admission controller (service/admission.py).
+# Times are epoch seconds so every dialect compares and stores them the same way.
+class LlmSlot(Base):
+    __tablename__ = "llm_slots"
+
+    slot = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String, nullable=True)
+    caller = Column(String, nullable=True)
+    expires_at = Column(Float, nullable=True)
+
+
+class LlmRateBucket(Base):
+    __tablename__ = "llm_rate_buckets"
+
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+
+class LlmCircuit(Base):
+    __tablename__ = "llm_circuits"
+
+    name = Column(String, primary_key=True)
+    failures = Column(Integer, nullable=False, default=0)
+    opened_until = Column(Float, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
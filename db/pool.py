@@ -0,0 +1,77 @@
+"""Connection pools that record how long checkouts wait, for sizing the pool."""
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+_lock = threading.Lock()
+_pools = {}
+_stats = {}
+
+
+def _new_stats():
+    return {"checkouts": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+
+class _TimedCheckoutMixin:
+    """Times `connect()`, i.e. waiting for a free connection (plus pre-ping or connect)"""
+
+    stats_name = "sync"
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with _lock:
+                _stats[self.stats_name]["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with _lock:
+                stats = _stats[self.stats_name]
+                stats["checkouts"] += 1
+                stats["wait_seconds_total"] += waited
+                stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+    def recreate(self):
+        pool = super().recreate()
+        register(pool, self.stats_name)
+        return pool
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    stats_name = "sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    stats_name = "async"
+
+
+def register(pool, name: str):
+    if not isinstance(pool, QueuePool):
+        return
+    with _lock:
+        _pools[name] = pool
+        _stats.setdefault(name, _new_stats())
+
+
+def stats():
+    """Checkout wait times plus current saturation for every registered pool"""
+    result = {}
+    with _lock:
+        for name, pool in _pools.items():
+            stats = dict(_stats[name])
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            checked_out = pool.checkedout()
+            stats.update(
+                pool_size=pool.size(),
+                max_overflow=pool._max_overflow,
+                checked_out=checked_out,
+                idle=pool.checkedin(),
+                saturation=round(checked_out / capacity, 3) if capacity else None,
+                wait_seconds_avg=stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0,
+            )
+            result[name] = stats
+    return result
@@ -0,0 +1,48 @@
+"""Count the SQL statements an operation emits, to catch N+1 query regressions.
+
+    with count_queries() as counter:
+        client.get("/courses/1/lessons")
+    assert counter.count <= 2, counter.statements
+
+Counters are tracked through a context variable, like the per-request stats in
+service.instrumentation: statements the block runs itself, in the threadpool or
+on the async engine are counted, background threads (job workers, the attempt
+writer) are not.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from db.database import async_engine, engine
+
+_active = contextvars.ContextVar("query_counters", default=())
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active.get():
+        counter.statements.append(statement)
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def count_queries():
+    """Record every statement the block executes on the sync or async engine"""
+    counter = QueryCounter()
+    token = _active.set(_active.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active.reset(token)
@@ -0,0 +1,79 @@
+"""Write path and stored representations of quizzes.
+
+Questions are stored twice, each form serving one access pattern:
+- `quizzes.questions_payload` holds the question list serialized once at write
+  time, so reads send those bytes without parsing or revalidating anything;
+- `quiz_questions` holds one ordered row per question, indexed by a hash of the
+  normalized question text, so quizzes containing a question are found through
+  an index instead of scanning JSON.
+"""
+import hashlib
+import json
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from db import bulk, models, schemas
+
+
+def validate_questions(questions) -> list:
+    """Check the model output against the Question schema and return plain dicts"""
+    return [schemas.Question.model_validate(question).model_dump() for question in questions]
+
+
+def serialize_questions(questions) -> str:
+    return json.dumps(questions, separators=(",", ":"), ensure_ascii=False)
+
+
+def question_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def question_rows(quiz_id: int, questions) -> list:
+    return [
+        {
+            "quiz_id": quiz_id,
+            "position": position,
+            "question": question["question"],
+            "question_hash": question_hash(question["question"]),
+            "options": question["options"],
+            "answer": question["answer"],
+        }
+        for position, question in enumerate(questions)
+    ]
+
+
+def add_quizzes(db: Session, quizzes: list) -> list:
+    """Insert quizzes given as dicts with lesson_id, content_hash and questions.
+
+    Uses multi-row INSERTs for the quizzes (with RETURNING) and for their question rows.
+    Returns the new ids in input order; the caller commits.
+    """
+    if not quizzes:
+        return []
+    rows = [{**quiz, "questions_payload": serialize_questions(quiz["questions"])} for quiz in quizzes]
+    quiz_ids = bulk.insert_ids(db, models.Quiz, rows)
+    question_table_rows = [
+        row for quiz_id, quiz in zip(quiz_ids, quizzes) for row in question_rows(quiz_id, quiz["questions"])
+    ]
+    if question_table_rows:
+        db.execute(insert(models.QuizQuestion), question_table_rows)
+    return list(quiz_ids)
+
+
+def add_quiz(db: Session, lesson_id: int, content_hash: str, questions) -> int:
+    return add_quizzes(db, [{"lesson_id": lesson_id, "content_hash": content_hash, "questions": questions}])[0]
+
+
+def quiz_body(quiz_id: int, lesson_id: int, payload: str) -> bytes:
+    """The QuizResponse JSON, assembled around the stored payload without parsing it"""
+    return f'{{"id":{quiz_id},"lesson_id":{lesson_id},"questions":{payload}}}'.encode("utf-8")
+
+
+def quizzes_with_question(question: str, limit: int = 100):
+    """Statement finding quiz questions whose normalized text matches, via the hash index"""
+    return select(models.QuizQuestion.quiz_id, models.Quiz.lesson_id, models.QuizQuestion.position) \
+        .join(models.Quiz, models.Quiz.id == models.QuizQuestion.quiz_id) \
+        .where(models.QuizQuestion.question_hash == question_hash(question)) \
+        .order_by(models.QuizQuestion.quiz_id) \
+        .limit(limit)
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from datetime import datetime
+from typing import Annotated, Dict, Literal, Optional, List, Union
 
 class User(BaseModel):
     username: str
@@ -7,6 +8,12 @@ class User(BaseModel):
     full_name: str | None = None
     disabled: bool | None = None
 
+class Principal(User):
+    id: int
+
+    class Config:
+        from_attributes = True
+
 class UserCreate(BaseModel):
     username: str
     email: str
@@ -30,6 +37,11 @@ class CourseResponse(CourseCreate):
     id: int
     lessons: List[int] = []
 
+    @field_validator("lessons", mode="before")
+    @classmethod
+    def lesson_ids(cls, lessons):
+        return [getattr(lesson, "id", lesson) for lesson in lessons]
+
     class Config:
         from_attributes = True
 
@@ -53,3 +65,124 @@ class QuizResponse(BaseModel):
     id: int
     lesson_id: int
     questions: List[Question]
+
+    class Config:
+        from_attributes = True
+
+class QuizQuestionMatch(BaseModel):
+    quiz_id: int
+    lesson_id: int
+    position: int
+
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    title: str
+    course_id: Optional[int] = None
+    snippet: str
+    score: float
+
+
+class AttemptSubmission(BaseModel):
+    # Chosen option per question, in question order; null for unanswered
+    answers: List[Optional[str]]
+
+
+class BatchAttemptSubmission(AttemptSubmission):
+    quiz_id: int
+
+
+class AttemptResult(BaseModel):
+    quiz_id: int
+    correct: int
+    total: int
+    score: float
+    results: List[bool]
+
+
+class QuestionAttemptStats(BaseModel):
+    position: int
+    answered: int
+    correct: int
+
+
+class QuizAttemptStatsResponse(BaseModel):
+    quiz_id: int
+    attempts: int
+    average_score: Optional[float] = None
+    # Attempts per score decile: "0" is 0-9%, ..., "10" is 100%
+    score_distribution: Dict[str, int]
+    questions: List[QuestionAttemptStats]
+
+
+class UserAttemptStatsResponse(BaseModel):
+    attempts: int
+    average_score: Optional[float] = None
+    last_attempt_at: Optional[datetime] = None
+
+
+class QuizJobResponse(BaseModel):
+    id: int
+    lesson_id: int
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    quiz: Optional[QuizResponse] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LessonQuizOutcome(BaseModel):
+    lesson_id: int
+    status: str
+    quiz_id: Optional[int] = None
+    error: Optional[str] = None
+
+class CourseQuizGenerationResponse(BaseModel):
+    course_id: int
+    results: List[LessonQuizOutcome]
+
+
+# Records of the NDJSON import/export format, one per line. `id` is the record's
+# reference within the file; lessons point at a course and quizzes at a lesson
+# either by reference (`course`, `lesson`) or by an existing database id.
+Reference = Union[int, str]
+
+
+class CourseRecord(CourseCreate):
+    type: Literal["course"]
+    id: Optional[Reference] = None
+
+
+class LessonRecord(LessonCreate):
+    type: Literal["lesson"]
+    id: Optional[Reference] = None
+    course: Optional[Reference] = None
+    course_id: Optional[int] = None
+
+
+class QuizRecord(BaseModel):
+    type: Literal["quiz"]
+    lesson: Optional[Reference] = None
+    lesson_id: Optional[int] = None
+    content_hash: Optional[str] = Field(None, max_length=64)
+    questions: List[Question]
+
+
+CatalogRecord = Annotated[Union[CourseRecord, LessonRecord, QuizRecord], Field(discriminator="type")]
+
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+
+class ImportSummary(BaseModel):
+    courses: int
+    courses_existing: int
+    lessons: int
+    quizzes: int
+    error_count: int
+    errors: List[ImportLineError]
@@ -1,24 +1,57 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from typing import Annotated
-from db import models
-from db.database import engine, get_db
+from db.database import async_engine, engine, get_db
+from db.migrations import run_migrations
 from sqlalchemy.orm import Session
+from routes.attempts import router as attempts_router
+from routes.catalog import router as catalog_router
 from routes.courses import router as courses_router
-from routes.auth import router as auth_router
+from routes.health import router as health_router
 from routes.lessons import router as lessons_router
 from routes.quizzes import router as quizzes_router
+from routes.search import router as search_router
+from routes.stats import router as stats_router
 from routes import auth
-
-app = FastAPI()
+from service import job_queue, quiz_attempts, quiz_generator
+from service.instrumentation import MetricsMiddleware
+
+# Schema changes normally run as a separate step (`python -m db.migrations`)
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if RUN_MIGRATIONS_ON_STARTUP:
+        await asyncio.to_thread(run_migrations, engine)
+    if quiz_generator.WARM_ON_STARTUP:
+        # Serve traffic while the model client loads; /ready reports when it is done
+        app.state.model_warmup = asyncio.create_task(asyncio.to_thread(quiz_generator.warm))
+    job_queue.start()
+    quiz_attempts.start()
+    yield
+    job_queue.stop()
+    quiz_attempts.stop()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 # models.Base.metadata.drop_all(bind=engine)
-models.Base.metadata.create_all(bind=engine)
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
+app.include_router(health_router)
 app.include_router(auth.router)
 app.include_router(courses_router)
 app.include_router(lessons_router)
 app.include_router(quizzes_router)
+app.include_router(attempts_router)
+app.include_router(search_router)
+app.include_router(catalog_router)
+app.include_router(stats_router)
 
 
 
@@ -0,0 +1,113 @@
+from typing import Annotated, List
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import models, schemas
+from db.database import get_async_db
+from routes.auth import get_current_active_user
+from service import quiz_attempts
+
+router = APIRouter(prefix="/quiz", tags=["Attempts"])
+
+MAX_BATCH_SIZE = 500
+
+
+def _buffer_full_exception():
+    return HTTPException(status_code=503, detail="Too many attempts waiting to be saved, try again shortly",
+                         headers={"Retry-After": "1"})
+
+
+def _result(quiz_id: int, results) -> dict:
+    correct = sum(results)
+    return {"quiz_id": quiz_id, "correct": correct, "total": len(results),
+            "score": correct / len(results) if results else 0.0, "results": results}
+
+
+async def _grade(db: AsyncSession, quiz_id: int, answers):
+    key = await quiz_attempts.answer_key(db, quiz_id)
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"Quiz {quiz_id} not found")
+    if len(answers) > len(key):
+        raise HTTPException(status_code=422, detail=f"Quiz {quiz_id} has only {len(key)} questions")
+    return quiz_attempts.grade(key, answers)
+
+
+@router.post("/{quiz_id}/attempts", response_model=schemas.AttemptResult)
+async def submit_attempt(
+    quiz_id: int,
+    submission: schemas.AttemptSubmission,
+    current_user: Annotated[schemas.Principal, Depends(get_current_active_user)],
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Grade the current user's answers and record the attempt"""
+    results = await _grade(db, quiz_id, submission.answers)
+    try:
+        await quiz_attempts.submit([quiz_attempts.attempt_row(quiz_id, current_user.id, submission.answers, results)])
+    except quiz_attempts.BufferFull:
+        raise _buffer_full_exception()
+    return _result(quiz_id, results)
+
+
+@router.post("/attempts/batch", response_model=List[schemas.AttemptResult])
+async def submit_attempts(
+    submissions: Annotated[List[schemas.BatchAttemptSubmission], Body(max_length=MAX_BATCH_SIZE)],
+    current_user: Annotated[schemas.Principal, Depends(get_current_active_user)],
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Grade and record several attempts by the current user at once, e.g. synced from a classroom device.
+
+    The batch is all or nothing: an unknown quiz or too many answers rejects every attempt.
+    """
+    rows, outcomes = [], []
+    for submission in submissions:
+        results = await _grade(db, submission.quiz_id, submission.answers)
+        rows.append(quiz_attempts.attempt_row(submission.quiz_id, current_user.id, submission.answers, results))
+        outcomes.append(_result(submission.quiz_id, results))
+    try:
+        await quiz_attempts.submit(rows)
+    except quiz_attempts.BufferFull:
+        raise _buffer_full_exception()
+    return outcomes
+
+
+@router.get("/attempts/stats", response_model=schemas.UserAttemptStatsResponse)
+async def get_my_attempt_stats(
+    current_user: Annotated[schemas.Principal, Depends(get_current_active_user)],
+    db: AsyncSession = Depends(get_async_db),
+):
+    """The current user's attempt count and average score"""
+    stats = await db.get(models.UserAttemptStats, current_user.id)
+    if stats is None:
+        return {"attempts": 0}
+    return {"attempts": stats.attempts, "average_score": stats.correct / stats.total if stats.total else None,
+            "last_attempt_at": stats.last_attempt_at}
+
+
+@router.get("/{quiz_id}/stats", response_model=schemas.QuizAttemptStatsResponse)
+async def get_quiz_attempt_stats(quiz_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Attempt count, score distribution and per-question correctness of a quiz"""
+    stats = await db.get(models.QuizAttemptStats, quiz_id)
+    if stats is None:
+        if await db.get(models.Quiz, quiz_id) is None:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        return {"quiz_id": quiz_id, "attempts": 0, "score_distribution": {}, "questions": []}
+
+    buckets = await db.execute(
+        select(models.QuizScoreBucket.bucket, models.QuizScoreBucket.attempts)
+        .where(models.QuizScoreBucket.quiz_id == quiz_id)
+        .order_by(models.QuizScoreBucket.bucket)
+    )
+    questions = await db.scalars(
+        select(models.QuizQuestionStats)
+        .where(models.QuizQuestionStats.quiz_id == quiz_id)
+        .order_by(models.QuizQuestionStats.position)
+    )
+    return {
+        "quiz_id": quiz_id,
+        "attempts": stats.attempts,
+        "average_score": stats.correct / stats.total if stats.total else None,
+        "score_distribution": {str(bucket): count for bucket, count in buckets},
+        "questions": [{"position": q.position, "answered": q.answered, "correct": q.correct} for q in questions],
+    }
@@ -1,25 +1,30 @@
 from typing import Annotated
-from fastapi import status, APIRouter
+from fastapi import status, APIRouter, Request
 import os
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
+import uuid
 
-from db.database import get_db
+from db.database import get_async_db
 from db import models
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from db.schemas import User, UserCreate
+from service import admission, password_hasher, principal_cache
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Put the user's `disabled` flag in issued tokens so disabled users are rejected without a lookup
+JWT_DISABLED_CLAIM = os.getenv("JWT_DISABLED_CLAIM", "false").lower() in ("1", "true", "yes")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = password_hasher.pwd_context
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 def verify_password(plain_password, hashed_password):
@@ -33,23 +38,40 @@ def get_password_hash(password):
 def get_user(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
-    if not user or not pwd_context.verify(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await db.scalar(select(models.User).where(models.User.username == username))
+    if not user:
+        return None
+    # Give the connection back to the pool while bcrypt runs
+    await db.commit()
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
+
+def hasher_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent password operations, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Resolve the token's user, from the principal cache when possible"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -60,13 +82,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         username = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise credentials_exception
 
-    user = get_user(db, username)
+    if payload.get("disabled"):
+        raise HTTPException(status_code=400, detail="Inactive user")
+
+    token_id = payload.get("jti")
+    principal = principal_cache.get(username, token_id)
+    if principal is not None:
+        return principal
+
+    user = await db.scalar(select(models.User).where(models.User.username == username))
     if user is None:
         raise credentials_exception
-    return user
+    return principal_cache.put(user, token_id)
 
 
 async def get_current_active_user(
@@ -76,21 +106,47 @@ async def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+
+async def identify_caller(request: Request):
+    """Attribute the request's model calls to its user, or to its client address when
+    anonymous, so the admission controller can share capacity fairly between callers.
+
+    Async on purpose: it then runs in the request's own context, which the sync
+    endpoint's threadpool call inherits.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    caller = None
+    if scheme.lower() == "bearer":
+        try:
+            caller = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except jwt.InvalidTokenError:
+            pass
+    if caller:
+        admission.set_caller(f"user:{caller}")
+    else:
+        admission.set_caller(f"ip:{request.client.host if request.client else 'unknown'}")
+
 router = APIRouter(prefix="/auth", tags=["Users"])
 
 @router.post("/login")
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except password_hasher.HasherBusy:
+        raise hasher_busy_exception()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
+    claims = {"sub": user.username}
+    if JWT_DISABLED_CLAIM:
+        claims["disabled"] = bool(user.disabled)
+    access_token = create_access_token(data=claims)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -102,12 +158,16 @@ async def read_users_me(
 
 
 @router.post("/register")
-async def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
+    await db.commit()
 
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await password_hasher.hash_password(user.password)
+    except password_hasher.HasherBusy:
+        raise hasher_busy_exception()
 
     new_user = models.User(
         username=user.username,
@@ -115,7 +175,6 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
 
     return {"message": "User registered successfully"}
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import models, schemas
+from db.database import get_async_db
+from routes.auth import get_current_active_user
+from service import catalog_transfer, http_cache
+
+router = APIRouter(tags=["Catalog"])
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines", "text/plain")
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+async def _upload_chunks(request: Request):
+    """The NDJSON bytes of the request: its body, or the `file` part of a multipart form"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        async for chunk in request.stream():
+            yield chunk
+        return
+    if content_type != "multipart/form-data":
+        raise HTTPException(status_code=415, detail="Send NDJSON (application/x-ndjson) or a multipart `file`")
+
+    # Starlette spools the uploaded file to disk past 1 MB, so it is never held in memory
+    async with request.form(max_files=1) as form:
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=422, detail="Multipart upload needs a `file` part")
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            yield chunk
+
+
+@router.post("/import", response_model=schemas.ImportSummary)
+async def import_catalog(request: Request, current_user: Annotated[schemas.User, Depends(get_current_active_user)]):
+    """Import courses, lessons and quizzes from NDJSON (see service/catalog_transfer.py).
+
+    Lines are written in batches of IMPORT_BATCH_SIZE, one transaction each, while the
+    upload is still being received. Invalid lines are skipped and reported by line number.
+    """
+    importer = catalog_transfer.Importer()
+    batch = []
+    number = 0
+    # Receive the next batch while the previous one is being written, at most one write at a time
+    writing = None
+    try:
+        try:
+            async for line in catalog_transfer.split_lines(_upload_chunks(request)):
+                number += 1
+                if line.strip():
+                    batch.append((number, line))
+                if len(batch) >= catalog_transfer.IMPORT_BATCH_SIZE:
+                    if writing is not None:
+                        await writing
+                    writing = asyncio.ensure_future(run_in_threadpool(importer.write, batch))
+                    batch = []
+        except catalog_transfer.LineTooLong:
+            raise HTTPException(status_code=413, detail=f"Line {number + 1} is longer than IMPORT_MAX_LINE_BYTES")
+        finally:
+            if writing is not None:
+                await writing
+        if batch:
+            await run_in_threadpool(importer.write, batch)
+    finally:
+        # Batches written before a failure stay committed, so their cached responses are stale too
+        if importer.counts["courses"]:
+            http_cache.invalidate_prefix(http_cache.COURSE_LIST_PREFIX)
+        http_cache.invalidate(*(http_cache.lesson_key(lesson_id) for lesson_id in importer.quiz_lesson_ids))
+    return importer.summary()
+
+
+@router.get("/export", response_class=StreamingResponse, responses={200: {"content": {"application/x-ndjson": {}}}})
+async def export_catalog(course_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    """Stream the whole catalog, or one course, as NDJSON that `POST /import` accepts"""
+    if course_id is not None and await db.scalar(select(models.Course.id).where(models.Course.id == course_id)) is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    # The request session stays open until the stream ends, so release its connection now
+    await db.commit()
+
+    filename = f"course-{course_id}.ndjson" if course_id is not None else "catalog.ndjson"
+    return StreamingResponse(
+        catalog_transfer.export_lines(course_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
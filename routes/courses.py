@@ -1,16 +1,44 @@
 from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from db.database import get_async_db, get_db
 from db import models
-from routes.auth import get_current_active_user
-from db.schemas import CourseCreate, CourseResponse, LessonCreate, LessonResponse, User
+from routes.auth import get_current_active_user, identify_caller
+from db.schemas import CourseCreate, CourseResponse, CourseQuizGenerationResponse, LessonCreate, LessonResponse, User
+from routes.lessons import LESSON_COLUMNS, LESSON_SUMMARY_FIELDS
+from routes.listing import PageParams, fetch_page, next_cursor_headers
+from service import http_cache, quiz_service
 
 router = APIRouter(prefix="/courses", tags=["Courses"])
 
-@router.get("/")
-def get_courses(db: Session = Depends(get_db)):
-    return list(db.query(models.Course).all())
+COURSE_COLUMNS = {
+    "id": models.Course.id,
+    "title": models.Course.title,
+    "description": models.Course.description,
+}
+COURSE_SUMMARY_FIELDS = ["id", "title"]
+
+
+def course_with_lesson_ids(course_id: int):
+    """Load a course and its lesson ids with one extra batched SELECT instead of lazy loads"""
+    return select(models.Course) \
+        .options(selectinload(models.Course.lessons).load_only(models.Lesson.id)) \
+        .where(models.Course.id == course_id)
+
+@router.get("/", response_model=List[dict])
+async def get_courses(request: Request, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    """Page through courses ordered by id (id and title unless `fields` asks for more).
+
+    Responses carry an ETag; send it back in `If-None-Match` to get `304 Not Modified`.
+    """
+    async def produce():
+        courses = await fetch_page(db, COURSE_COLUMNS, COURSE_SUMMARY_FIELDS, page)
+        return courses, next_cursor_headers(courses, page)
+
+    key = http_cache.course_list_key(page.limit, page.after_id, page.fields)
+    return await http_cache.respond(request, key, produce)
 
 @router.post("/", response_model=CourseResponse)
 def create_course(course: CourseCreate, db: Session = Depends(get_db)):
@@ -18,11 +46,12 @@ def create_course(course: CourseCreate, db: Session = Depends(get_db)):
     db.add(new_course)
     db.commit()
     db.refresh(new_course)
+    http_cache.invalidate_prefix(http_cache.COURSE_LIST_PREFIX)
     return new_course
 
-@router.get("/{course_id}")
+@router.get("/{course_id}", response_model=CourseResponse)
 def read_course(current_user: Annotated[User, Depends(get_current_active_user)], course_id: int, db: Session = Depends(get_db)):
-    course = db.query(models.Course).get(course_id)
+    course = db.scalars(course_with_lesson_ids(course_id)).first()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     return course
@@ -36,8 +65,8 @@ def update_course(course_id: int, updated_course: CourseCreate, db: Session = De
     course.title = updated_course.title
     course.description = updated_course.description
     db.commit()
-    db.refresh(course)
-    return course
+    http_cache.invalidate_prefix(http_cache.COURSE_LIST_PREFIX)
+    return db.scalars(course_with_lesson_ids(course_id).execution_options(populate_existing=True)).one()
 
 @router.delete("/{course_id}")
 def delete_course(course_id: int, db: Session = Depends(get_db)):
@@ -47,11 +76,15 @@ def delete_course(course_id: int, db: Session = Depends(get_db)):
 
     db.delete(course)
     db.commit()
+    http_cache.invalidate_prefix(http_cache.COURSE_LIST_PREFIX)
     return {"message": "Course deleted successfully"}
 
-@router.get("/{course_id}/lessons", response_model=List[LessonResponse])
-def get_lessons_by_course(course_id: int, db: Session = Depends(get_db)):
-    lessons = db.query(models.Lesson).filter(models.Lesson.course_id == course_id).all()
+@router.get("/{course_id}/lessons", response_model=List[dict])
+async def get_lessons_by_course(course_id: int, response: Response, page: PageParams = Depends(),
+                                db: AsyncSession = Depends(get_async_db)):
+    """Page through a course's lessons, served by the (course_id, id) index"""
+    lessons = await fetch_page(db, LESSON_COLUMNS, LESSON_SUMMARY_FIELDS, page, models.Lesson.course_id == course_id)
+    response.headers.update(next_cursor_headers(lessons, page))
     return lessons
 
 @router.post("/{course_id}/lessons", response_model=LessonResponse)
@@ -73,3 +106,20 @@ def create_lesson(course_id: int, lesson: LessonCreate, db: Session = Depends(ge
 
     return new_lesson
 
+
+@router.post("/{course_id}/quizzes/generate", response_model=CourseQuizGenerationResponse,
+             dependencies=[Depends(identify_caller)])
+async def generate_course_quizzes(
+    course_id: int,
+    concurrency: int = Query(quiz_service.BULK_CONCURRENCY, ge=1, le=32),
+    force_regenerate: bool = False,
+    question_count: int = Query(quiz_service.DEFAULT_QUESTION_COUNT, ge=1, le=quiz_service.MAX_QUESTION_COUNT),
+):
+    """Generate quizzes for all lessons of a course in one call.
+
+    `concurrency` is capped at the per-caller model call limit (LLM_MAX_CONCURRENT_PER_CALLER).
+    """
+    results = await quiz_service.create_course_quizzes(course_id, concurrency, force_regenerate, question_count)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return {"course_id": course_id, "results": results}
@@ -0,0 +1,44 @@
+import asyncio
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import inspect, select
+
+from db import migrations, models
+from db.database import async_engine
+from service import job_queue, metrics, quiz_attempts, quiz_generator
+
+router = APIRouter(tags=["Health"])
+
+READY_DB_TIMEOUT_SECONDS = float(os.getenv("READY_DB_TIMEOUT_SECONDS", "2"))
+
+
+async def _pending_migrations():
+    async with async_engine.connect() as conn:
+        table = models.SchemaMigration.__tablename__
+        if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(table)):
+            return migrations.pending(set())
+        return migrations.pending(set(await conn.scalars(select(models.SchemaMigration.name))))
+
+
+@router.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the database is reachable, the schema is current and,
+    with QUIZ_MODEL_WARMUP, the model client is initialized; 503 otherwise"""
+    report = {"database": "ok", "pending_migrations": [], "model": "warm" if quiz_generator.is_warm() else "cold",
+              "job_workers": job_queue.stats()["workers"], "attempt_writer": quiz_attempts.stats()["running"]}
+    try:
+        report["pending_migrations"] = await asyncio.wait_for(_pending_migrations(), READY_DB_TIMEOUT_SECONDS)
+    except Exception as exc:
+        report["database"] = f"unavailable: {type(exc).__name__}"
+
+    report["ready"] = (report["database"] == "ok" and not report["pending_migrations"]
+                       and (report["model"] == "warm" or not quiz_generator.WARM_ON_STARTUP))
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics of this process"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
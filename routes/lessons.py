@@ -1,25 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from db.database import get_db
+from db.database import get_async_db, get_db
 from db import models
 from db.schemas import LessonCreate, LessonResponse
+from routes.listing import PageParams, fetch_page, next_cursor_headers
+from service import http_cache, job_queue, quiz_attempts, quiz_cache
 from typing import List
 
+LESSON_COLUMNS = {
+    "id": models.Lesson.id,
+    "title": models.Lesson.title,
+    "course_id": models.Lesson.course_id,
+    "content": models.Lesson.content,
+    "quiz_id": models.latest_quiz_id(),
+}
+LESSON_SUMMARY_FIELDS = ["id", "title", "course_id", "quiz_id"]
+
+
+def lesson_with_quiz_id(lesson_id: int):
+    return select(models.Lesson).options(models.with_quiz_id()).where(models.Lesson.id == lesson_id)
+
 router = APIRouter(prefix="/lessons", tags=["Lessons"])
 
-@router.get("/", response_model=List[LessonResponse])
-def get_all_lessons(db: Session = Depends(get_db)):
-    lessons = db.query(models.Lesson).all()
-    if not lessons:
+@router.get("/", response_model=List[dict])
+async def get_all_lessons(response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    """Page through lessons ordered by id.
+
+    Returns the id, title, course_id and latest quiz_id of each lesson unless other
+    columns are requested with `fields`. When the page is full, the `X-Next-After-Id`
+    header holds the cursor for the next page.
+    """
+    lessons = await fetch_page(db, LESSON_COLUMNS, LESSON_SUMMARY_FIELDS, page)
+    if not lessons and page.after_id is None:
         raise HTTPException(status_code=404, detail="No lessons found")
+    response.headers.update(next_cursor_headers(lessons, page))
     return lessons
 
 @router.get("/{lesson_id}", response_model=LessonResponse)
-def read_lesson(lesson_id: int, db: Session = Depends(get_db)):
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-    return lesson
+async def read_lesson(lesson_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Return a lesson; supports `If-None-Match` with the ETag of a previous response"""
+    async def produce():
+        lesson = await db.scalar(lesson_with_quiz_id(lesson_id))
+        if not lesson:
+            raise HTTPException(status_code=404, detail="Lesson not found")
+        return LessonResponse.model_validate(lesson), None
+
+    return await http_cache.respond(request, http_cache.lesson_key(lesson_id), produce)
 
 @router.put("/{lesson_id}", response_model=LessonResponse)
 def update_lesson(lesson_id: int, updated_lesson: LessonCreate, db: Session = Depends(get_db)):
@@ -27,11 +55,15 @@ def update_lesson(lesson_id: int, updated_lesson: LessonCreate, db: Session = De
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
 
+    if lesson.content != updated_lesson.content:
+        # Chunk entries are content-addressed and stay valid for the unchanged paragraphs
+        quiz_cache.invalidate(db, *quiz_cache.content_keys(lesson.content))
+
     lesson.title = updated_lesson.title
     lesson.content = updated_lesson.content
     db.commit()
-    db.refresh(lesson)
-    return lesson
+    http_cache.invalidate(http_cache.lesson_key(lesson_id))
+    return db.scalars(lesson_with_quiz_id(lesson_id).execution_options(populate_existing=True)).one()
 
 @router.delete("/{lesson_id}")
 def delete_lesson(lesson_id: int, db: Session = Depends(get_db)):
@@ -39,8 +71,15 @@ def delete_lesson(lesson_id: int, db: Session = Depends(get_db)):
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
 
+    # Job rows are kept after they finish and quizzes cannot outlive their lesson, so both go first
+    job_queue.delete_for_lesson(db, lesson_id)
+    quiz_ids = [quiz.id for quiz in lesson.quizzes]
+    for quiz in lesson.quizzes:
+        quiz_attempts.delete_for_quiz(db, quiz.id)
+        db.delete(quiz)
     db.delete(lesson)
     db.commit()
+    http_cache.invalidate(http_cache.lesson_key(lesson_id), *map(http_cache.quiz_key, quiz_ids))
     return {"message": "Lesson deleted successfully"}
 
 
@@ -0,0 +1,58 @@
+"""Keyset pagination and column projection shared by the listing endpoints.
+
+Pages are fetched with `WHERE id > :after_id ORDER BY id LIMIT :limit`, which an
+index on id (or on (filter column, id)) serves in O(page size). Only the
+requested columns are selected, so large text columns are not loaded unless a
+client asks for them with `fields`.
+"""
+from fastapi import HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-After-Id"
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after_id: int | None = Query(None, ge=0, description="Return rows with an id greater than this cursor"),
+        fields: str | None = Query(None, description="Comma-separated columns to return, e.g. `id,title,content`"),
+    ):
+        self.limit = limit
+        self.after_id = after_id
+        self.fields = fields
+
+
+def select_fields(requested: str | None, columns: dict, default: list) -> list:
+    if not requested:
+        return default
+    names = list(dict.fromkeys(name.strip() for name in requested.split(",") if name.strip()))
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(columns)}",
+        )
+    # The id is the pagination cursor, so it is always returned
+    return names if "id" in names else ["id"] + names
+
+
+async def fetch_page(db: AsyncSession, columns: dict, default_fields: list, page: PageParams, *criteria) -> list:
+    """Return one page of rows as dicts holding only the selected fields"""
+    names = select_fields(page.fields, columns, default_fields)
+    id_column = columns["id"]
+    stmt = select(*(columns[name].label(name) for name in names)).where(*criteria)
+    if page.after_id is not None:
+        stmt = stmt.where(id_column > page.after_id)
+    stmt = stmt.order_by(id_column).limit(page.limit)
+    return [dict(row) for row in (await db.execute(stmt)).mappings()]
+
+
+def next_cursor_headers(rows: list, page: PageParams) -> dict:
+    """Cursor header for the next page, when this page is full"""
+    if len(rows) == page.limit:
+        return {NEXT_CURSOR_HEADER: str(rows[-1]["id"])}
+    return {}
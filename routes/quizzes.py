@@ -1,44 +1,144 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from db import models, schemas
-from db.database import get_db
-from service import quiz_generator
+from db import models, quiz_store, schemas
+from db.database import get_async_db, get_db
+from routes.auth import identify_caller
+from service import admission, http_cache, job_queue, quiz_attempts, quiz_service, single_flight
 import json
+import logging
+import math
+
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/quiz", tags=["Quiz"])
 
+MAX_QUESTION_COUNT = quiz_service.MAX_QUESTION_COUNT
+
+
+def admission_exception(exc):
+    """429 when model calls are saturated, 503 while the provider's circuit is open"""
+    return HTTPException(
+        status_code=429 if isinstance(exc, admission.Saturated) else 503,
+        detail=str(exc),
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+@router.post("/generate", response_model=schemas.QuizResponse, dependencies=[Depends(identify_caller)],
+             responses={202: {"description": "Generation job queued"}})
+def generate_quiz(
+    lesson_id: int,
+    force_regenerate: bool = False,
+    background: bool = False,
+    question_count: int = Query(quiz_service.DEFAULT_QUESTION_COUNT, ge=1, le=MAX_QUESTION_COUNT),
+    db: Session = Depends(get_db),
+):
+    """Return the quiz for the lesson's current content, generating it if needed.
+
+    Concurrent requests for the same lesson share one generation. `force_regenerate=true`
+    skips the cache and always creates a new quiz.
 
-@router.post("/generate", response_model=schemas.QuizResponse)
-def generate_quiz(lesson_id: int, db: Session = Depends(get_db)):
-    """Generate a new quiz dynamically from lesson content"""
+    With `background=true` the generation is queued and a job id is returned for polling.
+    """
 
     lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
 
-    lesson_content = lesson.content
+    if background:
+        job = job_queue.enqueue(db, lesson_id, force_regenerate, question_count)
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
 
-    questions_json = quiz_generator.generate_quiz(lesson_content)
-    questions = json.loads(questions_json)
-    # print(questions_json)
+    try:
+        return quiz_service.create_lesson_quiz(db, lesson, force_regenerate, question_count)
+    except single_flight.FlightTimeout:
+        raise HTTPException(status_code=504, detail="Quiz generation for this lesson is still in progress")
+    except (admission.Saturated, admission.CircuitOpen) as exc:
+        raise admission_exception(exc)
 
-    new_quiz = models.Quiz(lesson_id=lesson_id, questions=questions)
-    db.add(new_quiz)
+
+@router.get("/generate/stream", dependencies=[Depends(identify_caller)])
+def stream_quiz(
+    lesson_id: int,
+    force_regenerate: bool = False,
+    question_count: int = Query(quiz_service.DEFAULT_QUESTION_COUNT, ge=1, le=MAX_QUESTION_COUNT),
+    db: Session = Depends(get_db),
+):
+    """Stream the lesson's quiz as NDJSON, sending each question as soon as the model completes it.
+
+    Every line is `{"event": "question", "data": {...}}`; the last line is either
+    `{"event": "done", "data": {"quiz_id": ...}}` or `{"event": "error", "data": {"detail": ...}}`.
+    """
+    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    events = quiz_service.stream_lesson_quiz(lesson.id, lesson.content, force_regenerate, question_count)
+    # The request session stays open until the stream ends, so release its connection now
     db.commit()
-    db.refresh(new_quiz)
 
-    return new_quiz
+    # Run up to the first question before answering, so a model call that is not admitted
+    # gets its status code and Retry-After instead of an error line in a 200 stream
+    try:
+        first = next(events, None)
+    except single_flight.FlightTimeout:
+        raise HTTPException(status_code=504, detail="Quiz generation for this lesson is still in progress")
+    except (admission.Saturated, admission.CircuitOpen) as exc:
+        raise admission_exception(exc)
+    except Exception as exc:
+        logger.exception("Streaming quiz generation failed for lesson %s", lesson_id)
+        first, events = ("error", {"detail": str(exc)}), iter(())
+
+    def ndjson():
+        try:
+            if first is not None:
+                yield json.dumps({"event": first[0], "data": first[1]}) + "\n"
+            for event, data in events:
+                yield json.dumps({"event": event, "data": data}) + "\n"
+        except Exception as exc:
+            logger.exception("Streaming quiz generation failed for lesson %s", lesson_id)
+            yield json.dumps({"event": "error", "data": {"detail": str(exc)}}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.QuizJobResponse)
+def get_quiz_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.QuizJob).filter(models.QuizJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/", response_model=list[schemas.QuizQuestionMatch])
+def find_quizzes(
+    question: str = Query(..., min_length=1),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """Find quizzes containing a question, matched on its whitespace- and case-normalized text"""
+    rows = db.execute(quiz_store.quizzes_with_question(question, limit)).all()
+    return [{"quiz_id": quiz_id, "lesson_id": lesson_id, "position": position}
+            for quiz_id, lesson_id, position in rows]
 
 
 @router.get("/{quiz_id}", response_model=schemas.QuizResponse)
-def get_quiz(quiz_id: int, db: Session = Depends(get_db)):
-    quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id).first()
-    if not quiz:
-        raise HTTPException(status_code=404, detail="Quiz not found")
+async def get_quiz(quiz_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Return a quiz. Quizzes are immutable, so responses are cacheable and carry an ETag"""
+    async def produce():
+        row = (await db.execute(
+            select(models.Quiz.id, models.Quiz.lesson_id, models.Quiz.questions_payload)
+            .where(models.Quiz.id == quiz_id)
+        )).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Quiz not found")
 
-    if isinstance(quiz.questions, str):
-        quiz.questions = json.loads(quiz.questions)
+        # The payload was validated and serialized when the quiz was written
+        return quiz_store.quiz_body(*row), None
 
-    return quiz
+    return await http_cache.respond(request, http_cache.quiz_key(quiz_id), produce, http_cache.IMMUTABLE)
 
 
 @router.delete("/{lesson_id}", response_model=dict)
@@ -47,7 +147,11 @@ def delete_quiz(quiz_id: int, db: Session = Depends(get_db)):
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
+    lesson_id = quiz.lesson_id
+    quiz_attempts.delete_for_quiz(db, quiz_id)
+    job_queue.detach_quiz(db, quiz_id)
     db.delete(quiz)
     db.commit()
+    http_cache.invalidate(http_cache.quiz_key(quiz_id), http_cache.lesson_key(lesson_id))
     return {"message": "Quiz deleted successfully"}
 
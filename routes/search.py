@@ -0,0 +1,47 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import schemas
+from db.database import get_async_db
+from service import search as search_service
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+NEXT_OFFSET_HEADER = "X-Next-Offset"
+TRUNCATED_HEADER = "X-Results-Truncated"
+MAX_LIMIT = 100
+
+
+@router.get("", response_model=list[schemas.SearchResult])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[Literal["course", "lesson"]] = None,
+    limit: int = Query(20, ge=1, le=MAX_LIMIT),
+    offset: int = Query(0, ge=0, le=10_000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Search course titles and descriptions and lesson titles and content.
+
+    Results are ranked best first and carry a snippet with the matched terms wrapped
+    in `<mark>`. When more results may follow, the `X-Next-Offset` header holds the
+    offset of the next page. Only the best SEARCH_MAX_CANDIDATES results can be paged
+    through; a page cut short by that cap carries `X-Results-Truncated: true`.
+    """
+    kinds = (type,) if type else search_service.KINDS
+    page_limit = min(limit, search_service.MAX_CANDIDATES - offset)
+    if page_limit <= 0:
+        response.headers[TRUNCATED_HEADER] = "true"
+        return []
+    try:
+        results = await search_service.search(db, q, kinds, page_limit + 1, offset)
+    except NotImplementedError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    if len(results) > page_limit:
+        if offset + page_limit < search_service.MAX_CANDIDATES:
+            response.headers[NEXT_OFFSET_HEADER] = str(offset + page_limit)
+        else:
+            response.headers[TRUNCATED_HEADER] = "true"
+    return results[:page_limit]
@@ -0,0 +1,61 @@
+from fastapi import APIRouter
+from db import pool
+from service import (
+    admission, http_cache, job_queue, password_hasher, principal_cache, quiz_attempts, quiz_cache, single_flight,
+)
+
+router = APIRouter(prefix="/stats", tags=["Stats"])
+
+
+@router.get("/quiz-cache")
+def get_quiz_cache_stats():
+    """Hit, miss and eviction counters for the quiz cache"""
+    return quiz_cache.stats()
+
+
+@router.get("/quiz-jobs")
+def get_quiz_job_stats():
+    """Queue depth and outcome counters for background quiz generation"""
+    return job_queue.stats()
+
+
+@router.get("/quiz-attempts")
+def get_quiz_attempt_stats():
+    """Write-behind buffer depth and counters for submitted quiz attempts"""
+    return quiz_attempts.stats()
+
+
+@router.get("/llm-admission")
+def get_llm_admission_stats():
+    """Admitted and rejected model calls, in-flight permits and the provider circuit state"""
+    return admission.stats()
+
+
+@router.get("/single-flight")
+def get_single_flight_stats():
+    """How many generation requests were coalesced onto an in-flight call"""
+    return single_flight.stats()
+
+
+@router.get("/db-pool")
+def get_db_pool_stats():
+    """Connection checkout wait times and saturation of the sync and async pools"""
+    return pool.stats()
+
+
+@router.get("/password-hasher")
+def get_password_hasher_stats():
+    """In-flight, rejected and rehashed password operations"""
+    return password_hasher.stats()
+
+
+@router.get("/principal-cache")
+def get_principal_cache_stats():
+    """Hit and miss counters for the authenticated principal cache"""
+    return principal_cache.stats()
+
+
+@router.get("/http-cache")
+def get_http_cache_stats():
+    """Hit, miss and 304 counters for cached GET responses"""
+    return http_cache.stats()
@@ -0,0 +1,466 @@
+"""Admission control for outbound model calls.
+
+Every call to the quiz provider first takes a permit:
+- a concurrency slot, at most LLM_MAX_CONCURRENT in total and
+  LLM_MAX_CONCURRENT_PER_CALLER per caller, so one user's bulk generation
+  cannot take every slot;
+- a token from the request bucket (LLM_REQUESTS_PER_MINUTE, bursts of
+  LLM_REQUEST_BURST) and, when LLM_TOKENS_PER_MINUTE is set, prompt tokens from
+  the token bucket, matching the provider's RPM/TPM quota.
+
+When no permit is available the call waits until its deadline (the caller's
+wait budget) and then raises `Saturated`; interactive requests default to no
+wait at all (LLM_ADMISSION_WAIT_SECONDS=0) so they get a fast `429` instead of
+holding a worker thread. Fan-outs that issue many calls at once (chunked
+lessons, bulk course generation) wait for `batch_wait_seconds`, which leaves
+the buckets time to refill for the calls beyond their burst. After LLM_BREAKER_FAILURES consecutive transient
+provider errors the circuit opens and calls fail with `CircuitOpen` for
+LLM_BREAKER_COOLDOWN_SECONDS; then a single probe call is let through.
+
+The state lives in a store selected by LLM_ADMISSION_STORE: `database` (the
+default) keeps it in the `llm_*` tables so the limits hold across uvicorn
+workers; `memory` keeps it in the process, for single-worker setups and tests.
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from sqlalchemy import case, func, or_, select, update
+
+from db import bulk, models
+from db.database import engine
+from service import metrics, providers, single_flight
+
+STORE = os.getenv("LLM_ADMISSION_STORE", "database")
+MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "16"))
+MAX_CONCURRENT_PER_CALLER = int(os.getenv("LLM_MAX_CONCURRENT_PER_CALLER", str(max(1, MAX_CONCURRENT // 2))))
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+REQUEST_BURST = float(os.getenv("LLM_REQUEST_BURST", "10"))
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+WAIT_SECONDS = float(os.getenv("LLM_ADMISSION_WAIT_SECONDS", "0"))
+BACKGROUND_WAIT_SECONDS = float(os.getenv("LLM_BACKGROUND_WAIT_SECONDS", "30"))
+POLL_SECONDS = float(os.getenv("LLM_ADMISSION_POLL_SECONDS", "0.1"))
+# A slot whose holder died is reclaimed after this long
+SLOT_TTL_SECONDS = float(os.getenv("LLM_SLOT_TTL_SECONDS", "300"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+ADMISSIONS = metrics.Counter(
+    "llm_admissions", "Outbound model call admission decisions", ("outcome",),
+)
+ADMISSION_WAIT_SECONDS = metrics.Histogram(
+    "llm_admission_wait_seconds", "Time a model call waited for a permit",
+    buckets=(0, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+_lock = threading.Lock()
+_stats = {"admitted": 0, "saturated": 0, "circuit_open": 0, "probes": 0}
+_in_flight = 0
+
+
+class Saturated(Exception):
+    """Raised when no permit became available before the caller's deadline"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Model calls are saturated ({reason}), retry in {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Exception):
+    """Raised while the provider is considered down"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Quiz generation is temporarily unavailable, retry in {math.ceil(retry_after)}s")
+        self.retry_after = retry_after
+
+
+class _Caller:
+    __slots__ = ("name", "wait_seconds")
+
+    def __init__(self, name: str, wait_seconds: float):
+        self.name = name
+        self.wait_seconds = wait_seconds
+
+
+_caller = contextvars.ContextVar("llm_caller", default=_Caller("anonymous", WAIT_SECONDS))
+
+
+def set_caller(name: str, wait_seconds: float = WAIT_SECONDS):
+    """Attribute the model calls of the current request to `name`"""
+    _caller.set(_Caller(name, wait_seconds))
+
+
+@contextmanager
+def caller_scope(name: str, wait_seconds: float = BACKGROUND_WAIT_SECONDS):
+    token = _caller.set(_Caller(name, wait_seconds))
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def bind_caller(fn, wait_seconds: float | None = None):
+    """Wrap `fn` to run as the current caller (with its wait budget unless `wait_seconds` is
+    given), for executors that do not copy context variables"""
+    caller = _caller.get()
+    wait_seconds = caller.wait_seconds if wait_seconds is None else wait_seconds
+
+    def run(*args, **kwargs):
+        with caller_scope(caller.name, wait_seconds):
+            return fn(*args, **kwargs)
+    return run
+
+
+def batch_wait_seconds(calls: int, prompt_tokens: int = 0) -> float:
+    """Wait budget for `calls` model calls issued together: the caller's own budget, at least
+    BACKGROUND_WAIT_SECONDS, plus the time the buckets need to admit what exceeds their burst"""
+    refill = 0.0
+    if REQUESTS_PER_MINUTE:
+        refill = max(calls - max(1.0, REQUEST_BURST), 0) * 60 / REQUESTS_PER_MINUTE
+    if TOKENS_PER_MINUTE:
+        refill = max(refill, (prompt_tokens - TOKENS_PER_MINUTE) * 60 / TOKENS_PER_MINUTE)
+    return max(_caller.get().wait_seconds, BACKGROUND_WAIT_SECONDS) + refill
+
+
+class Bucket(NamedTuple):
+    name: str
+    cost: float
+    per_second: float
+    capacity: float
+
+
+class _Conflict(Exception):
+    """Another worker changed a slot or bucket between reading and updating it"""
+
+
+class _Rejected(Exception):
+    def __init__(self, reason: str, wait: float):
+        self.reason = reason
+        self.wait = wait
+
+
+class MemoryStore:
+    """Admission state of this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._buckets = {}
+        self._failures = 0
+        self._opened_until = 0.0
+
+    def acquire(self, owner: str, caller: str, limit: int, per_caller: int, ttl: float, buckets):
+        """Claim a slot and every bucket's cost together: (slot, None, 0) or (None, reason, wait)"""
+        now = time.time()
+        with self._lock:
+            live = {slot: held for slot, held in self._slots.items() if held[2] > now and slot < limit}
+            if sum(held[1] == caller for held in live.values()) >= per_caller:
+                return None, "caller", POLL_SECONDS
+            slot = next((slot for slot in range(limit) if slot not in live), None)
+            if slot is None:
+                return None, "concurrency", POLL_SECONDS
+            levels = {}
+            for bucket in buckets:
+                tokens, updated_at = self._buckets.get(bucket.name, (bucket.capacity, now))
+                tokens = min(bucket.capacity, tokens + (now - updated_at) * bucket.per_second)
+                if tokens < bucket.cost:
+                    return None, bucket.name, (bucket.cost - tokens) / bucket.per_second
+                levels[bucket.name] = tokens - bucket.cost
+            for name, tokens in levels.items():
+                self._buckets[name] = (tokens, now)
+            self._slots[slot] = (owner, caller, now + ttl)
+            return slot, None, 0.0
+
+    def release(self, slot: int, owner: str, success, threshold: int, cooldown: float):
+        """Free the slot and, unless `success` is None, record the call's outcome"""
+        with self._lock:
+            if self._slots.get(slot, (None,))[0] == owner:
+                del self._slots[slot]
+            if success:
+                self._failures, self._opened_until = 0, 0.0
+            elif success is not None:
+                self._failures += 1
+                if self._failures >= threshold:
+                    self._opened_until = time.time() + cooldown
+
+    def circuit(self):
+        with self._lock:
+            return self._failures, self._opened_until
+
+    def start_probe(self, opened_until: float, until: float) -> bool:
+        with self._lock:
+            if self._opened_until != opened_until:
+                return False
+            self._opened_until = until
+            return True
+
+
+class DatabaseStore:
+    """Admission state in the `llm_*` tables, shared by every process using the database.
+
+    Slots are pre-created rows and both they and the buckets are taken with conditional
+    UPDATEs in one transaction, so concurrent workers never overshoot a limit.
+    """
+
+    CIRCUIT = "provider"
+
+    def __init__(self, bind=engine):
+        self.bind = bind
+        self._slots_created = 0
+
+    def _insert(self, model):
+        return bulk.dialect_insert(self.bind, model)
+
+    def acquire(self, owner: str, caller: str, limit: int, per_caller: int, ttl: float, buckets):
+        """Claim a slot and every bucket's cost together: (slot, None, 0) or (None, reason, wait)"""
+        if self._slots_created < limit:
+            with self.bind.begin() as conn:
+                conn.execute(self._insert(models.LlmSlot).on_conflict_do_nothing(index_elements=["slot"]),
+                             [{"slot": slot} for slot in range(limit)])
+            self._slots_created = limit
+        for _ in range(5):
+            try:
+                with self.bind.begin() as conn:
+                    slot = self._claim_slot(conn, owner, caller, limit, per_caller, ttl)
+                    for bucket in buckets:
+                        self._take(conn, bucket)
+                    return slot, None, 0.0
+            except _Rejected as rejected:
+                # Leaving the transaction rolled back the slot and tokens already taken
+                return None, rejected.reason, rejected.wait
+            except _Conflict:
+                continue
+        return None, "contention", POLL_SECONDS
+
+    def _claim_slot(self, conn, owner, caller, limit, per_caller, ttl) -> int:
+        slots = models.LlmSlot.__table__
+        now = time.time()
+
+        def free(table):
+            return or_(table.c.owner.is_(None), table.c.expires_at <= now)
+
+        candidates = slots.alias("candidates")
+        mine = slots.alias("mine")
+        # A single conditional UPDATE: concurrent workers can only ever claim a free slot, and
+        # one that lost the race for it sees no row updated and retries
+        slot = conn.scalar(
+            update(slots)
+            .where(
+                slots.c.slot == select(func.min(candidates.c.slot))
+                .where(candidates.c.slot < limit, free(candidates)).scalar_subquery(),
+                free(slots),
+                select(func.count()).select_from(mine)
+                .where(mine.c.caller == caller, ~free(mine)).scalar_subquery() < per_caller,
+            )
+            .values(owner=owner, caller=caller, expires_at=now + ttl)
+            .returning(slots.c.slot)
+        )
+        if slot is not None:
+            return slot
+        held = conn.execute(select(slots.c.caller).where(slots.c.slot < limit, ~free(slots))).scalars().all()
+        if held.count(caller) >= per_caller:
+            raise _Rejected("caller", POLL_SECONDS)
+        if len(held) >= limit:
+            raise _Rejected("concurrency", POLL_SECONDS)
+        raise _Conflict()
+
+    def _take(self, conn, bucket: Bucket):
+        rates = models.LlmRateBucket.__table__
+        now = time.time()
+        refilled = rates.c.tokens + (now - rates.c.updated_at) * bucket.per_second
+        level = case((refilled > bucket.capacity, bucket.capacity), else_=refilled)
+        # Refill and take in one statement, so the hot row is never read-modify-written
+        taken = conn.execute(
+            update(rates).where(rates.c.name == bucket.name, level >= bucket.cost)
+            .values(tokens=level - bucket.cost, updated_at=now)
+        )
+        if taken.rowcount == 1:
+            return
+        tokens = conn.scalar(select(level).where(rates.c.name == bucket.name))
+        if tokens is not None:
+            raise _Rejected(bucket.name, max(bucket.cost - tokens, 0) / bucket.per_second)
+        created = conn.execute(
+            self._insert(models.LlmRateBucket).values(name=bucket.name, tokens=bucket.capacity - bucket.cost,
+                                                      updated_at=now)
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        if created.rowcount != 1:
+            raise _Conflict()
+
+    def release(self, slot: int, owner: str, success, threshold: int, cooldown: float):
+        """Free the slot and, unless `success` is None, record the call's outcome"""
+        slots = models.LlmSlot.__table__
+        circuits = models.LlmCircuit.__table__
+        with self.bind.begin() as conn:
+            conn.execute(
+                update(slots).where(slots.c.slot == slot, slots.c.owner == owner)
+                .values(owner=None, caller=None, expires_at=None)
+            )
+            if success:
+                conn.execute(update(circuits).where(circuits.c.name == self.CIRCUIT).values(failures=0, opened_until=0))
+            elif success is not None:
+                conn.execute(
+                    self._insert(models.LlmCircuit).values(name=self.CIRCUIT, failures=1, opened_until=0)
+                    .on_conflict_do_update(index_elements=["name"], set_={"failures": circuits.c.failures + 1})
+                )
+                conn.execute(
+                    update(circuits).where(circuits.c.name == self.CIRCUIT, circuits.c.failures >= threshold)
+                    .values(opened_until=time.time() + cooldown)
+                )
+
+    def circuit(self):
+        table = models.LlmCircuit.__table__
+        with self.bind.connect() as conn:
+            row = conn.execute(select(table.c.failures, table.c.opened_until).where(table.c.name == self.CIRCUIT)).first()
+        return (row.failures, row.opened_until) if row else (0, 0.0)
+
+    def start_probe(self, opened_until: float, until: float) -> bool:
+        table = models.LlmCircuit.__table__
+        with self.bind.begin() as conn:
+            result = conn.execute(
+                update(table).where(table.c.name == self.CIRCUIT, table.c.opened_until == opened_until)
+                .values(opened_until=until)
+            )
+        return result.rowcount == 1
+
+
+def create_store():
+    if STORE == "memory":
+        return MemoryStore()
+    if STORE == "database":
+        return DatabaseStore()
+    raise ValueError(f"Unknown LLM_ADMISSION_STORE {STORE!r}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_store()
+        return _store
+
+
+def set_store(store):
+    """Replace the store, e.g. with a MemoryStore in benchmarks"""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def _check_circuit(store):
+    """Raise CircuitOpen while the circuit is open.
+
+    Returns (probe, healthy): whether this call is the half-open probe, and whether no
+    failures were recorded, in which case a success has nothing to reset.
+    """
+    failures, opened_until = store.circuit()
+    if not opened_until:
+        return False, not failures
+    now = time.time()
+    if opened_until > now:
+        raise CircuitOpen(opened_until - now)
+    # Cooldown is over: let exactly one caller probe the provider, the others keep failing fast
+    if not store.start_probe(opened_until, now + BREAKER_COOLDOWN_SECONDS):
+        raise CircuitOpen(BREAKER_COOLDOWN_SECONDS)
+    return True, False
+
+
+def _buckets(prompt_tokens: int):
+    buckets = []
+    if REQUESTS_PER_MINUTE:
+        buckets.append(Bucket("requests", 1, REQUESTS_PER_MINUTE / 60, max(1.0, REQUEST_BURST)))
+    if TOKENS_PER_MINUTE:
+        # A prompt larger than the whole quota could never be admitted otherwise
+        buckets.append(Bucket("tokens", min(prompt_tokens, TOKENS_PER_MINUTE), TOKENS_PER_MINUTE / 60, TOKENS_PER_MINUTE))
+    return buckets
+
+
+def _acquire(store, caller: _Caller, prompt_tokens: int):
+    owner = single_flight.new_owner()
+    deadline = time.monotonic() + caller.wait_seconds
+    buckets = _buckets(prompt_tokens)
+    while True:
+        slot, reason, wait = store.acquire(
+            owner, caller.name, MAX_CONCURRENT, MAX_CONCURRENT_PER_CALLER, SLOT_TTL_SECONDS, buckets,
+        )
+        if slot is not None:
+            return slot, owner
+        if wait > deadline - time.monotonic():
+            raise Saturated(reason, max(wait, POLL_SECONDS))
+        time.sleep(wait)
+
+
+@contextmanager
+def permit(prompt_tokens: int = 0):
+    """Hold an admission permit for one model call.
+
+    Transient provider errors raised inside the block count towards opening the circuit.
+    """
+    global _in_flight
+    store = get_store()
+    caller = _caller.get()
+    start = time.perf_counter()
+    try:
+        probe, healthy = _check_circuit(store)
+        slot, owner = _acquire(store, caller, prompt_tokens)
+    except CircuitOpen:
+        _count("circuit_open")
+        raise
+    except Saturated:
+        _count("saturated")
+        raise
+    ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+    _count("admitted")
+    with _lock:
+        _in_flight += 1
+        if probe:
+            _stats["probes"] += 1
+
+    success = None
+    try:
+        yield
+        success = True
+    except providers.TRANSIENT_ERRORS:
+        success = False
+        raise
+    finally:
+        with _lock:
+            _in_flight -= 1
+        # Only failures and the first success after them change the circuit. Other errors
+        # (bad prompts, abandoned streams) say nothing about the provider's health.
+        outcome = None if success is None or (success and healthy) else success
+        store.release(slot, owner, outcome, BREAKER_FAILURES, BREAKER_COOLDOWN_SECONDS)
+
+
+def _count(outcome: str):
+    ADMISSIONS.inc(outcome)
+    with _lock:
+        _stats[outcome] += 1
+
+
+def stats():
+    store = get_store()
+    failures, opened_until = store.circuit()
+    now = time.time()
+    circuit = "closed" if not opened_until else ("open" if opened_until > now else "half_open")
+    with _lock:
+        return {
+            **_stats,
+            "in_flight": _in_flight,
+            "store": type(store).__name__,
+            "circuit": circuit,
+            "consecutive_failures": failures,
+            "max_concurrent": MAX_CONCURRENT,
+            "max_concurrent_per_caller": MAX_CONCURRENT_PER_CALLER,
+            "requests_per_minute": REQUESTS_PER_MINUTE,
+            "tokens_per_minute": TOKENS_PER_MINUTE,
+        }
@@ -0,0 +1,211 @@
+"""Bulk import and export of courses, lessons and quizzes as NDJSON.
+
+The format is one JSON record per line, see `schemas.CatalogRecord`:
+
+    {"type": "course", "id": 1, "title": "...", "description": "..."}
+    {"type": "lesson", "id": 7, "course": 1, "title": "...", "content": "..."}
+    {"type": "quiz", "lesson": 7, "content_hash": "...", "questions": [...]}
+
+Records may only refer to records earlier in the file (or to existing rows by
+`course_id`/`lesson_id`), which is the order exports are written in, so an
+export can be imported as-is.
+
+Imports are written IMPORT_BATCH_SIZE lines at a time: each batch is validated,
+inserted with multi-row INSERTs and committed, so memory stays
+bounded by the batch and the map of file references to new ids. Invalid lines
+are skipped and reported; batches before a failure stay committed. Exports
+stream each table through a server-side cursor (`yield_per`), holding one
+pooled connection until the stream ends.
+"""
+import json
+import os
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from db import bulk, models, quiz_store, schemas
+from db.database import SessionLocal, engine
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+IMPORT_MAX_REPORTED_ERRORS = 100
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+_record = TypeAdapter(schemas.CatalogRecord)
+
+
+class LineTooLong(Exception):
+    """Raised when an upload line exceeds IMPORT_MAX_LINE_BYTES"""
+
+
+async def split_lines(chunks):
+    """Yield the lines of a byte stream without holding more than one line in memory"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        if b"\n" not in chunk:
+            if len(buffer) > IMPORT_MAX_LINE_BYTES:
+                raise LineTooLong()
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def _validation_detail(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+class Importer:
+    """Writes batches of NDJSON lines, remembering the ids given to referenced records"""
+
+    def __init__(self):
+        self.course_ids = {}
+        self.lesson_ids = {}
+        # Lessons that received a quiz, whose cached responses are stale after the import
+        self.quiz_lesson_ids = set()
+        self.counts = {"courses": 0, "courses_existing": 0, "lessons": 0, "quizzes": 0}
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, line: int, detail: str):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+    def write(self, lines: list):
+        """Validate and insert `(line number, raw line)` pairs in one transaction"""
+        records = {"course": [], "lesson": [], "quiz": []}
+        for number, line in lines:
+            try:
+                record = _record.validate_json(line)
+            except ValidationError as exc:
+                self.error(number, _validation_detail(exc))
+                continue
+            records[record.type].append((number, record))
+
+        with SessionLocal() as db:
+            self._write_courses(db, records["course"])
+            self._write_lessons(db, records["lesson"])
+            self._write_quizzes(db, records["quiz"])
+            db.commit()
+
+    def _write_courses(self, db: Session, records):
+        if not records:
+            return
+        # Titles are unique: a course that already exists is reused rather than duplicated
+        titles = {record.title for _, record in records}
+        existing = dict(db.execute(
+            select(models.Course.title, models.Course.id).where(models.Course.title.in_(titles))
+        ).all())
+        new = {}
+        for _, record in records:
+            if record.title in existing:
+                self.counts["courses_existing"] += 1
+            else:
+                new.setdefault(record.title, {"title": record.title, "description": record.description or ""})
+        if new:
+            rows = list(new.values())
+            ids = bulk.insert_ids(db, models.Course, rows)
+            existing.update(zip(new, ids))
+            self.counts["courses"] += len(rows)
+        for _, record in records:
+            if record.id is not None:
+                self.course_ids[record.id] = existing[record.title]
+
+    def _resolve(self, db: Session, records, model, reference: str, known: dict, required: bool):
+        """Pair each record with the database id of its parent, reporting records whose parent is unknown"""
+        id_field = f"{reference}_id"
+        wanted = {getattr(record, id_field) for _, record in records} - {None}
+        found = set(db.scalars(select(model.id).where(model.id.in_(wanted)))) if wanted else set()
+        resolved = []
+        for number, record in records:
+            ref, parent_id = getattr(record, reference), getattr(record, id_field)
+            if ref is not None:
+                parent_id = known.get(ref)
+                if parent_id is None:
+                    self.error(number, f"{reference}: unknown {reference} reference {ref!r}")
+                    continue
+            elif parent_id is not None and parent_id not in found:
+                self.error(number, f"{id_field}: {reference} {parent_id} does not exist")
+                continue
+            elif parent_id is None and required:
+                self.error(number, f"{reference}: `{reference}` or `{id_field}` is required")
+                continue
+            resolved.append((record, parent_id))
+        return resolved
+
+    def _write_lessons(self, db: Session, records):
+        resolved = self._resolve(db, records, models.Course, "course", self.course_ids, required=False)
+        if not resolved:
+            return
+        rows = [{"title": record.title, "content": record.content, "course_id": course_id}
+                for record, course_id in resolved]
+        ids = bulk.insert_ids(db, models.Lesson, rows)
+        for (record, _), lesson_id in zip(resolved, ids):
+            if record.id is not None:
+                self.lesson_ids[record.id] = lesson_id
+        self.counts["lessons"] += len(rows)
+
+    def _write_quizzes(self, db: Session, records):
+        resolved = self._resolve(db, records, models.Lesson, "lesson", self.lesson_ids, required=True)
+        if not resolved:
+            return
+        quiz_store.add_quizzes(db, [
+            {"lesson_id": lesson_id, "content_hash": record.content_hash,
+             "questions": [question.model_dump() for question in record.questions]}
+            for record, lesson_id in resolved
+        ])
+        self.quiz_lesson_ids.update(lesson_id for _, lesson_id in resolved)
+        self.counts["quizzes"] += len(resolved)
+
+    def summary(self) -> dict:
+        return {**self.counts, "error_count": self.error_count,
+                "errors": sorted(self.errors, key=lambda error: error["line"])}
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _course_line(row) -> str:
+    return _dumps({"type": "course", "id": row.id, "title": row.title, "description": row.description})
+
+
+def _lesson_line(row) -> str:
+    return _dumps({"type": "lesson", "id": row.id, "course": row.course_id, "title": row.title,
+                   "content": row.content})
+
+
+def _quiz_line(row) -> str:
+    # The stored payload is already the serialized question list
+    return (f'{{"type":"quiz","id":{row.id},"lesson":{row.lesson_id},'
+            f'"content_hash":{json.dumps(row.content_hash)},"questions":{row.questions_payload}}}')
+
+
+def export_lines(course_id: int | None = None):
+    """Yield the catalog (or one course) as NDJSON, one chunk of EXPORT_BATCH_SIZE lines at a time"""
+    courses = select(models.Course.id, models.Course.title, models.Course.description).order_by(models.Course.id)
+    lessons = select(models.Lesson.id, models.Lesson.course_id, models.Lesson.title, models.Lesson.content) \
+        .order_by(models.Lesson.id)
+    quizzes = select(models.Quiz.id, models.Quiz.lesson_id, models.Quiz.content_hash, models.Quiz.questions_payload) \
+        .order_by(models.Quiz.id)
+    if course_id is not None:
+        courses = courses.where(models.Course.id == course_id)
+        lessons = lessons.where(models.Lesson.course_id == course_id)
+        quizzes = quizzes.join(models.Lesson, models.Lesson.id == models.Quiz.lesson_id) \
+            .where(models.Lesson.course_id == course_id)
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        if engine.dialect.name == "postgresql":
+            # One snapshot for the three queries, so every exported reference resolves
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        for statement, line in ((courses, _course_line), (lessons, _lesson_line), (quizzes, _quiz_line)):
+            for rows in conn.execute(statement).partitions():
+                yield "".join(line(row) + "\n" for row in rows).encode("utf-8")
@@ -0,0 +1,82 @@
+"""Local deterministic quiz provider that needs no API key.
+
+Enabled with QUIZ_PROVIDER=fake. It answers with a deterministic quiz built from
+the prompt (with as many questions as the prompt asks for) and, when streaming,
+emits it in small chunks with configurable delays so time-to-first-question can
+be observed locally. Latency, failure rate and answer size are configurable, so
+the generation path can be load-tested offline:
+
+- FAKE_MODEL_FIRST_CHUNK_DELAY, FAKE_MODEL_CHUNK_DELAY, FAKE_MODEL_CHUNK_SIZE:
+  streaming speed; a non-streamed answer takes as long as the full stream;
+- FAKE_MODEL_ERROR_RATE: share of calls failing with ProviderUnavailable;
+- FAKE_MODEL_QUESTION_WORDS: filler words added to each question, for larger answers;
+- FAKE_MODEL_SEED: seed for the injected failures.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from service.providers import Completion, ProviderUnavailable, QuizProvider
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+class FakeProvider(QuizProvider):
+    name = "fake"
+    model_name = "fake"
+
+    def __init__(self, question_count=None, first_chunk_delay=None, chunk_delay=None, chunk_size=None,
+                 error_rate=None, question_words=None, seed=None):
+        self.question_count = question_count
+        self.first_chunk_delay = first_chunk_delay if first_chunk_delay is not None \
+            else _env_float("FAKE_MODEL_FIRST_CHUNK_DELAY", "0.2")
+        self.chunk_delay = chunk_delay if chunk_delay is not None else _env_float("FAKE_MODEL_CHUNK_DELAY", "0.05")
+        self.chunk_size = chunk_size or int(os.getenv("FAKE_MODEL_CHUNK_SIZE", "16"))
+        self.error_rate = error_rate if error_rate is not None else _env_float("FAKE_MODEL_ERROR_RATE", "0")
+        self.question_words = question_words if question_words is not None \
+            else int(os.getenv("FAKE_MODEL_QUESTION_WORDS", "0"))
+        seed = seed if seed is not None else os.getenv("FAKE_MODEL_SEED")
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _answer(self, prompt):
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        requested = re.search(r"exactly (\d+) multiple-choice", prompt)
+        count = self.question_count or (int(requested.group(1)) if requested else 3)
+        filler = "".join(f" {seed}{word}" for word in range(self.question_words))
+        questions = [
+            {
+                "question": f"Question {i + 1} about lesson {seed}{filler}?",
+                "options": [f"A) {seed}-{i}-a", f"B) {seed}-{i}-b", f"C) {seed}-{i}-c", f"D) {seed}-{i}-d"],
+                "answer": f"A) {seed}-{i}-a",
+            }
+            for i in range(count)
+        ]
+        return json.dumps(questions, indent=2)
+
+    def _maybe_fail(self):
+        with self._random_lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise ProviderUnavailable("Injected fake provider failure")
+
+    def generate(self, prompt):
+        text = self._answer(prompt)
+        time.sleep(self.first_chunk_delay + self.chunk_delay * (len(text) // self.chunk_size))
+        self._maybe_fail()
+        return Completion(text)
+
+    def stream(self, prompt):
+        text = self._answer(prompt)
+        time.sleep(self.first_chunk_delay)
+        self._maybe_fail()
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                time.sleep(self.chunk_delay)
+            yield text[start:start + self.chunk_size]
@@ -0,0 +1,107 @@
+"""Server-side cache of serialized GET responses with strong ETags.
+
+Bodies are serialized once and kept by key together with their ETag (a hash of
+the body), so a hit costs neither a query nor serialization, and a matching
+`If-None-Match` is answered with `304 Not Modified`. Write handlers invalidate
+the keys they affect. The cache is per process; HTTP_CACHE_TTL_SECONDS bounds
+how long another worker can serve a body that was invalidated elsewhere.
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+
+from cachetools import TTLCache
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+HTTP_CACHE_MAX_SIZE = int(os.getenv("HTTP_CACHE_MAX_SIZE", "2048"))
+HTTP_CACHE_TTL_SECONDS = float(os.getenv("HTTP_CACHE_TTL_SECONDS", "60"))
+
+# Quizzes never change once generated; other resources are revalidated with their ETag
+IMMUTABLE = "public, max-age=3600"
+REVALIDATE = "public, no-cache"
+
+_cache = TTLCache(maxsize=HTTP_CACHE_MAX_SIZE, ttl=HTTP_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+
+COURSE_LIST_PREFIX = "courses:"
+
+
+def course_list_key(limit, after_id, fields) -> str:
+    return f"{COURSE_LIST_PREFIX}{limit}:{after_id}:{fields}"
+
+
+def lesson_key(lesson_id: int) -> str:
+    return f"lesson:{lesson_id}"
+
+
+def quiz_key(quiz_id: int) -> str:
+    return f"quiz:{quiz_id}"
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def respond(request: Request, key: str, produce, cache_control: str = REVALIDATE) -> Response:
+    """Serve `key` from the cache, calling `produce()` on a miss.
+
+    `produce` (sync or async) returns `(content, headers)`, where content is either
+    JSON-encodable or an already serialized JSON body as bytes; it may raise
+    HTTPException, in which case nothing is cached.
+    """
+    with _lock:
+        entry = _cache.get(key)
+        _stats["hits" if entry is not None else "misses"] += 1
+
+    if entry is None:
+        result = produce()
+        if inspect.isawaitable(result):
+            result = await result
+        content, headers = result
+        if isinstance(content, bytes):
+            body = content
+        else:
+            body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode("utf-8")
+        entry = (body, _etag(body), dict(headers or {}))
+        with _lock:
+            _cache[key] = entry
+
+    body, etag, headers = entry
+    headers = {**headers, "ETag": etag, "Cache-Control": cache_control}
+    if _matches(request, etag):
+        with _lock:
+            _stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def invalidate(*keys: str):
+    with _lock:
+        for key in keys:
+            _cache.pop(key, None)
+        _stats["invalidations"] += 1
+
+
+def invalidate_prefix(prefix: str):
+    with _lock:
+        for key in [key for key in list(_cache.keys()) if key.startswith(prefix)]:
+            _cache.pop(key, None)
+        _stats["invalidations"] += 1
+
+
+def stats():
+    with _lock:
+        return {**_stats, "size": len(_cache), "max_size": _cache.maxsize, "ttl_seconds": _cache.ttl}
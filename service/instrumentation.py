@@ -0,0 +1,272 @@
+"""Request-level instrumentation.
+
+MetricsMiddleware records per-route latency plus the number and duration of the
+SQL statements each request ran (collected by engine events through a context
+variable, so statements run in the threadpool or by the async engine are
+attributed to the request that issued them). Queue and threadpool depths are
+read when /metrics is scraped.
+
+Users listed in PROFILE_ADMINS can add `?profile=1` to any request: it then runs
+under a sampling profiler and the response is replaced by the samples as folded
+stacks (`frame;frame;frame count` lines), ready for flamegraph.pl or speedscope.
+Only the request's own work is sampled: its coroutine on the event loop and the
+threadpool jobs it submitted, not concurrent requests or background threads.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from urllib.parse import parse_qs
+
+import jwt
+from anyio import to_thread
+from sqlalchemy import event
+from starlette.responses import Response
+
+from db import pool
+from db.database import async_engine, engine
+from service import job_queue, metrics, password_hasher, quiz_attempts, single_flight
+
+PROFILE_ADMINS = {name.strip() for name in os.getenv("PROFILE_ADMINS", "").split(",") if name.strip()}
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "2")) / 1000
+
+REQUEST_SECONDS = metrics.Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status"),
+)
+REQUEST_SQL_STATEMENTS = metrics.Histogram(
+    "http_request_sql_statements", "SQL statements executed per request", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_SQL_SECONDS = metrics.Histogram(
+    "http_request_sql_seconds", "Time spent executing SQL per request", ("method", "route"),
+)
+SQL_STATEMENT_SECONDS = metrics.Histogram(
+    "db_statement_duration_seconds", "Duration of every SQL statement, including background work",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class RequestStats:
+    __slots__ = ("statements", "sql_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    SQL_STATEMENT_SECONDS.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _queue_depths():
+    attempts = quiz_attempts.stats()
+    return {
+        ("quiz_jobs",): job_queue.stats()["queued"],
+        ("quiz_attempts",): attempts["buffered"],
+        ("password_hashes",): password_hasher.stats()["in_flight"],
+        ("single_flight",): single_flight.stats()["in_flight"],
+    }
+
+
+def _threadpool():
+    # Only callable from the event loop, which is where /metrics renders
+    limiter = to_thread.current_default_thread_limiter()
+    return {
+        ("busy",): limiter.borrowed_tokens,
+        ("size",): limiter.total_tokens,
+        ("waiting",): limiter.statistics().tasks_waiting,
+    }
+
+
+def _db_pools():
+    values = {}
+    for name, stats in pool.stats().items():
+        values[name, "checked_out"] = stats["checked_out"]
+        values[name, "idle"] = stats["idle"]
+        values[name, "capacity"] = stats["pool_size"] + max(stats["max_overflow"], 0)
+    return values
+
+
+metrics.Gauge("app_queue_depth", "Work waiting or in flight per in-process queue", _queue_depths, ("queue",))
+metrics.Gauge("app_threadpool_threads", "Threadpool running sync endpoints and dependencies", _threadpool, ("state",))
+metrics.Gauge("db_pool_connections", "Database pool connections by state", _db_pools, ("pool", "state"))
+metrics.Gauge("db_pool_checkout_wait_seconds", "Total time spent waiting for a pooled connection",
+              lambda: {(name,): stats["wait_seconds_total"] for name, stats in pool.stats().items()}, ("pool",))
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+def _wants_profile(scope) -> bool:
+    if not PROFILE_ADMINS or b"profile=" not in scope.get("query_string", b""):
+        return False
+    if parse_qs(scope["query_string"].decode("latin-1")).get("profile") != ["1"]:
+        return False
+    from routes.auth import ALGORITHM, SECRET_KEY
+
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
+        return False
+    return payload.get("sub") in PROFILE_ADMINS and not payload.get("disabled")
+
+
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+
+def _is_idle(frame) -> bool:
+    """Threads parked on a lock, queue or selector are not doing work for anyone"""
+    filename = os.path.basename(frame.f_code.co_filename)
+    return (filename, frame.f_code.co_name) in _IDLE_FRAMES
+
+
+_profiled = contextvars.ContextVar("profiled_request", default=None)
+
+
+def _request_frames(frame, sampler, request_frame):
+    """The part of a thread's stack that works for the profiled request, or None.
+
+    On the event loop thread that is the stack while the request's own coroutine is
+    running; in a threadpool worker, the job it runs when that job was submitted from
+    the request's context (anyio runs every job as `context.run(func)`).
+    """
+    stack = []
+    while frame is not None:
+        if frame is request_frame:
+            return stack
+        context = frame.f_locals.get("context") if frame.f_code.co_name == "run" else None
+        if isinstance(context, contextvars.Context) and context.get(_profiled) is sampler:
+            return stack
+        stack.append(frame)
+        frame = frame.f_back
+    return None
+
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of the threads working for one request until stopped"""
+
+    def __init__(self, interval: float, request_frame):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.request_frame = request_frame
+        self.samples = 0
+        self.stacks = StackCounter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or _is_idle(frame):
+                    continue
+                frames = _request_frames(frame, self, self.request_frame)
+                if not frames:
+                    continue
+                stack = [f"{f.f_code.co_name} ({os.path.basename(f.f_code.co_filename)}:"
+                         f"{f.f_code.co_firstlineno})" for f in frames]
+                stack.append(names.get(ident, str(ident)).replace(" ", "_"))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+async def _profile(app, scope, receive, send):
+    status = None
+
+    async def discard(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    # This coroutine's frame is on the event loop thread's stack exactly while the request runs there
+    sampler = _Sampler(PROFILE_INTERVAL_SECONDS, sys._getframe())
+    token = _profiled.set(sampler)
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        await app(scope, receive, discard)
+    finally:
+        sampler.stop()
+        _profiled.reset(token)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    response = Response(sampler.folded(), media_type="text/plain", headers={
+        "X-Profile-Status": str(status),
+        "X-Profile-Samples": str(sampler.samples),
+        "X-Profile-Duration-Ms": f"{elapsed_ms:.1f}",
+    })
+    await response(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and counting its SQL statements"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if _wants_profile(scope):
+            return await _profile(self.app, scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            method, route = scope["method"], _route_label(scope)
+            REQUEST_SECONDS.observe(elapsed, method, route, str(status))
+            REQUEST_SQL_STATEMENTS.observe(stats.statements, method, route)
+            REQUEST_SQL_SECONDS.observe(stats.sql_seconds, method, route)
@@ -0,0 +1,259 @@
+"""Background quiz generation jobs.
+
+Jobs are rows in `quiz_jobs`, so the queue survives a restart: on startup, and
+every QUIZ_JOB_SWEEP_SECONDS after, every pending job (or running job whose
+lease has expired) is queued again. A graceful stop hands the jobs still running
+back as pending. A worker claims a job with a conditional UPDATE, which keeps
+two uvicorn processes from running the same job; a job waiting out its retry
+backoff keeps `locked_until` as the time it may run again.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import timedelta
+
+from pydantic import ValidationError
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import models
+from db.database import SessionLocal
+from service import admission, quiz_generator, quiz_service, single_flight
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("QUIZ_JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("QUIZ_JOB_MAX_ATTEMPTS", "3"))
+JOB_BACKOFF_SECONDS = float(os.getenv("QUIZ_JOB_BACKOFF_SECONDS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("QUIZ_JOB_LEASE_SECONDS", "300"))
+JOB_SWEEP_SECONDS = float(os.getenv("QUIZ_JOB_SWEEP_SECONDS", "30"))
+
+# A malformed model answer is usually fixed by asking again
+RETRYABLE_ERRORS = quiz_generator.TRANSIENT_ERRORS + (json.JSONDecodeError, ValidationError,
+                                                     single_flight.FlightTimeout, admission.Saturated,
+                                                     admission.CircuitOpen)
+
+_queue = queue.Queue()
+_threads = []
+# Set by stop(); each start() makes a new one so workers still finishing a job from before exit
+_stopping = threading.Event()
+_lock = threading.Lock()
+# Job ids waiting in `_queue`, so sweeps do not queue them twice
+_queued = set()
+# (job id, worker thread) claims held by this process, and those handed back by stop(), whose
+# outcome is no longer ours to write
+_running = set()
+_released = set()
+_stats = {"succeeded": 0, "failed": 0, "retried": 0, "released": 0}
+_OUTCOMES = {"succeeded": "succeeded", "failed": "failed", "pending": "retried"}
+
+
+def _put(job_id: int):
+    with _lock:
+        if job_id in _queued:
+            return
+        _queued.add(job_id)
+    _queue.put(job_id)
+
+
+def enqueue(db: Session, lesson_id: int, force_regenerate: bool = False,
+            question_count: int | None = None) -> models.QuizJob:
+    job = models.QuizJob(lesson_id=lesson_id, force_regenerate=force_regenerate, question_count=question_count)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _put(job.id)
+    return job
+
+
+def detach_quiz(db: Session, quiz_id: int):
+    """Clear the job references to a quiz that is being deleted; the caller commits"""
+    db.execute(update(models.QuizJob).where(models.QuizJob.quiz_id == quiz_id).values(quiz_id=None))
+
+
+def delete_for_lesson(db: Session, lesson_id: int):
+    """Delete the jobs of a lesson that is being deleted, finished or not; the caller commits"""
+    db.execute(delete(models.QuizJob).where(models.QuizJob.lesson_id == lesson_id))
+
+
+def _claimable(now):
+    return or_(
+        (models.QuizJob.status == "pending")
+        & (models.QuizJob.locked_until.is_(None) | (models.QuizJob.locked_until <= now)),
+        (models.QuizJob.status == "running") & (models.QuizJob.locked_until < now),
+    )
+
+
+def _claim(db: Session, job_id: int) -> bool:
+    now = models.utcnow()
+    result = db.execute(
+        update(models.QuizJob)
+        .where(models.QuizJob.id == job_id, _claimable(now))
+        .values(
+            status="running",
+            attempts=models.QuizJob.attempts + 1,
+            locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+            updated_at=now,
+        )
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _finish(db: Session, job: models.QuizJob, status: str, error: str | None = None, quiz_id: int | None = None,
+            retry_at=None) -> bool:
+    claim = (job.id, threading.get_ident())
+    with _lock:
+        _running.discard(claim)
+        if claim in _released:
+            # stop() already handed the job back; another worker may own it now
+            _released.discard(claim)
+            db.rollback()
+            return False
+    job.status = status
+    job.error = error
+    job.quiz_id = quiz_id
+    job.locked_until = retry_at
+    db.commit()
+    _stats[_OUTCOMES[status]] += 1
+    return True
+
+
+def _run(job_id: int, stopping: threading.Event):
+    with SessionLocal() as db:
+        if stopping.is_set() or not _claim(db, job_id):
+            return
+        with _lock:
+            _running.add((job_id, threading.get_ident()))
+        job = db.get(models.QuizJob, job_id)
+        lesson = db.get(models.Lesson, job.lesson_id)
+        if lesson is None:
+            _finish(db, job, "failed", error="Lesson not found")
+            return
+
+        try:
+            with admission.caller_scope("jobs"):
+                quiz = quiz_service.create_lesson_quiz(
+                    db, lesson, job.force_regenerate, job.question_count or quiz_service.DEFAULT_QUESTION_COUNT
+                )
+        except RETRYABLE_ERRORS as exc:
+            db.rollback()
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                _finish(db, job, "failed", error=str(exc))
+                return
+            delay = JOB_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+            # Do not retry before the admission controller expects capacity back
+            delay = max(delay, getattr(exc, "retry_after", 0))
+            if not _finish(db, job, "pending", error=str(exc), retry_at=models.utcnow() + timedelta(seconds=delay)):
+                return
+            timer = threading.Timer(delay, _put, args=(job_id,))
+            timer.daemon = True
+            timer.start()
+            return
+        except Exception as exc:
+            logger.exception("Quiz job %s failed", job_id)
+            db.rollback()
+            _finish(db, job, "failed", error=str(exc))
+            return
+
+        _finish(db, job, "succeeded", quiz_id=quiz.id)
+
+
+def _worker(stopping: threading.Event):
+    while True:
+        job_id = _queue.get()
+        try:
+            if stopping.is_set():
+                if job_id is not None:
+                    # Left for the workers of the next start(), if any
+                    _queue.put(job_id)
+                return
+            if job_id is None:
+                # A wake-up for a worker of an earlier start()
+                continue
+            with _lock:
+                _queued.discard(job_id)
+            _run(job_id, stopping)
+        except Exception:
+            logger.exception("Quiz job worker error")
+        finally:
+            _queue.task_done()
+
+
+def _requeue_unfinished():
+    with SessionLocal() as db:
+        job_ids = db.scalars(
+            select(models.QuizJob.id).where(_claimable(models.utcnow())).order_by(models.QuizJob.id)
+        ).all()
+    for job_id in job_ids:
+        _put(job_id)
+
+
+def _sweeper(stopping: threading.Event):
+    """Requeue jobs whose lease expired or that another process handed back, until stop()"""
+    while not stopping.wait(JOB_SWEEP_SECONDS):
+        try:
+            _requeue_unfinished()
+        except SQLAlchemyError:
+            logger.exception("Could not requeue unfinished quiz jobs")
+
+
+def _release_running():
+    """Hand the jobs this process is still running back to the queue, for the next process to run"""
+    with _lock:
+        job_ids = [job_id for job_id, _ in _running]
+        _released.update(_running)
+        _running.clear()
+    if not job_ids:
+        return
+    with SessionLocal() as db:
+        result = db.execute(
+            update(models.QuizJob)
+            .where(models.QuizJob.id.in_(job_ids), models.QuizJob.status == "running")
+            .values(status="pending", locked_until=None, attempts=models.QuizJob.attempts - 1,
+                    updated_at=models.utcnow())
+        )
+        db.commit()
+    _stats["released"] += result.rowcount
+
+
+def start():
+    """Queue jobs left over from a previous process and start the worker and sweeper threads"""
+    global _stopping
+    if _threads:
+        return
+    _stopping = threading.Event()
+    try:
+        _requeue_unfinished()
+    except SQLAlchemyError:
+        # Keep serving; /ready reports the database or schema problem
+        logger.exception("Could not requeue unfinished quiz jobs")
+    for i in range(JOB_WORKERS):
+        thread = threading.Thread(target=_worker, args=(_stopping,), name=f"quiz-job-{i}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+    thread = threading.Thread(target=_sweeper, args=(_stopping,), name="quiz-job-sweeper", daemon=True)
+    thread.start()
+    _threads.append(thread)
+
+
+def stop():
+    """Stop the threads; jobs that do not finish within the join timeout go back to pending"""
+    _stopping.set()
+    for _ in range(JOB_WORKERS):
+        _queue.put(None)
+    for thread in _threads:
+        thread.join(timeout=5)
+    _threads.clear()
+    try:
+        _release_running()
+    except SQLAlchemyError:
+        # Their leases expire and the next sweep picks them up
+        logger.exception("Could not release running quiz jobs")
+
+
+def stats():
+    return {**_stats, "queued": _queue.qsize(), "running": len(_running), "workers": JOB_WORKERS if _threads else 0}
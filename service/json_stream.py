@@ -0,0 +1,59 @@
+import json
+
+
+class JsonArrayParser:
+    """Incrementally parse a JSON array of objects arriving in arbitrary text chunks.
+
+    `feed` returns the elements completed by the new text, so each one can be handled
+    before the rest of the array has arrived. Anything before the opening bracket
+    (e.g. a stray markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def feed(self, text: str) -> list:
+        items = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._depth == 0:
+                if char == "]":
+                    self._finished = True
+                elif char in "{[":
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    items.append(json.loads("".join(self._buffer)))
+                    self._buffer = []
+        return items
@@ -0,0 +1,119 @@
+"""Process-local metrics in the Prometheus text exposition format.
+
+A small registry of counters, histograms and callback gauges, rendered by
+GET /metrics. Like the /stats endpoints, values are per process: with several
+uvicorn workers each worker is scraped (or sampled) on its own.
+"""
+import bisect
+import math
+import threading
+
+_lock = threading.Lock()
+_registry = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, label_values, extra, value in self._samples():
+            labels = _format_labels(self.label_names, label_values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with _lock:
+            items = list(self._values.items())
+        return [("_total", labels, (), value) for labels, value in sorted(items)]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        with _lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with _lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+        samples = []
+        for labels, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", labels, (("le", _format_value(float(bound))),), cumulative))
+            samples.append(("_sum", labels, (), total))
+            samples.append(("_count", labels, (), count))
+        return samples
+
+
+class Gauge(_Metric):
+    """Gauge read at scrape time from `collect()`, which returns {label values tuple: value}"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, collect, labels=()):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def _samples(self):
+        try:
+            values = self.collect()
+        except Exception:
+            # A broken collector must not take the whole scrape down
+            return []
+        return [("", labels, (), value) for labels, value in sorted(values.items())]
+
+
+def render() -> str:
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,70 @@
+"""Bcrypt hashing off the event loop.
+
+A bcrypt hash or check costs 100-300 ms of CPU, so running it inline in an
+`async def` handler stalls every other request on the worker. Hashing runs on a
+small dedicated thread pool instead (bcrypt releases the GIL while it works).
+At most PASSWORD_HASH_QUEUE_LIMIT operations may be running or waiting; beyond
+that callers get `HasherBusy` immediately rather than queueing without bound.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+# Hashes with a different cost factor are flagged for update, so changing
+# BCRYPT_ROUNDS rehashes passwords transparently on the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_lock = threading.Lock()
+_in_flight = 0
+_stats = {"completed": 0, "rejected": 0, "rehashed": 0}
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashing operations are already running or queued"""
+
+
+async def _run(fn, *args):
+    global _in_flight
+    with _lock:
+        if _in_flight >= HASH_QUEUE_LIMIT:
+            _stats["rejected"] += 1
+            raise HasherBusy()
+        _in_flight += 1
+    try:
+        return await asyncio.wrap_future(_executor.submit(fn, *args))
+    finally:
+        with _lock:
+            _in_flight -= 1
+            _stats["completed"] += 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_and_update(password: str, hashed_password: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash should be replaced"""
+    valid, new_hash = await _run(pwd_context.verify_and_update, password, hashed_password)
+    if new_hash:
+        with _lock:
+            _stats["rehashed"] += 1
+    return valid, new_hash
+
+
+def stats():
+    with _lock:
+        return {**_stats, "in_flight": _in_flight, "workers": HASH_WORKERS, "queue_limit": HASH_QUEUE_LIMIT}
@@ -0,0 +1,66 @@
+"""Short-lived cache of authenticated principals.
+
+Tokens are valid for minutes, so looking the user up on every request is mostly
+wasted work. Principals are cached per (username, token id) for a few seconds.
+Changing a user's `disabled` flag or password, or deleting the user, drops
+their entries through ORM attribute events. The cache is per process, so
+PRINCIPAL_CACHE_TTL_SECONDS bounds how long another worker may keep a stale
+entry.
+"""
+import os
+import threading
+
+from cachetools import TTLCache
+from sqlalchemy import event
+
+from db import models, schemas
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+
+_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def get(username: str, token_id: str | None) -> schemas.Principal | None:
+    with _lock:
+        principal = _cache.get((username, token_id))
+        _stats["hits" if principal is not None else "misses"] += 1
+        return principal
+
+
+def put(user: models.User, token_id: str | None) -> schemas.Principal:
+    principal = schemas.Principal.model_validate(user)
+    with _lock:
+        _cache[(principal.username, token_id)] = principal
+    return principal
+
+
+def invalidate_user(username: str):
+    with _lock:
+        for key in [key for key in list(_cache.keys()) if key[0] == username]:
+            _cache.pop(key, None)
+        _stats["invalidations"] += 1
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def stats():
+    with _lock:
+        return {**_stats, "size": len(_cache), "max_size": _cache.maxsize, "ttl_seconds": _cache.ttl}
+
+
+@event.listens_for(models.User.disabled, "set")
+@event.listens_for(models.User.hashed_password, "set")
+def _user_credentials_changed(target, value, oldvalue, initiator):
+    if target.username is not None and value != oldvalue:
+        invalidate_user(target.username)
+
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    invalidate_user(target.username)
@@ -0,0 +1,144 @@
+"""Quiz generation providers.
+
+A provider turns a prompt into the model's raw text answer, either at once or
+as a stream of text chunks. QUIZ_PROVIDER selects one:
+- `gemini` (default): Google Gemini, see GeminiProvider;
+- `fake`: a local deterministic model with configurable latency, error rate and
+  output size, for offline development and load tests (service/fake_provider.py).
+
+QUIZ_MODEL=fake is still accepted as an alias for QUIZ_PROVIDER=fake.
+"""
+import os
+import threading
+from typing import NamedTuple
+
+
+class ProviderUnavailable(Exception):
+    """Transient provider failure that is worth retrying"""
+
+
+# Provider errors worth retrying: quota, overload and timeouts. Providers raise their
+# SDK's transient errors as ProviderUnavailable, so no SDK is imported to catch them.
+TRANSIENT_ERRORS = (ProviderUnavailable,)
+
+
+class Completion(NamedTuple):
+    text: str
+    # Token usage as reported by the provider, None when it does not report it
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+class QuizProvider:
+    name = None
+    # Part of every quiz cache key, so quizzes from different models are never mixed up
+    model_name = None
+
+    def generate(self, prompt: str) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, prompt: str):
+        """Yield the answer as text chunks while it is being generated"""
+        raise NotImplementedError
+
+    def warm(self):
+        """Load whatever the first call would otherwise have to load"""
+
+    @property
+    def is_warm(self) -> bool:
+        return True
+
+
+class GeminiProvider(QuizProvider):
+    """Google Gemini. google.generativeai (grpc, protobuf) takes about half a second to
+    import, so it is only imported and configured on first use or by warm()"""
+    name = "gemini"
+
+    def __init__(self, model_name: str = "gemini-1.5-pro-latest", api_key: str | None = None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._genai = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def _model(self):
+        return self._client().GenerativeModel(self.model_name)
+
+    @staticmethod
+    def _transient(exc) -> bool:
+        # google.api_core (and grpc) is already loaded by the time the SDK raised
+        from google.api_core import exceptions
+        return isinstance(exc, (exceptions.ResourceExhausted, exceptions.ServiceUnavailable,
+                                exceptions.DeadlineExceeded, exceptions.InternalServerError))
+
+    def generate(self, prompt: str) -> Completion:
+        try:
+            response = self._model().generate_content(prompt)
+        except Exception as exc:
+            if self._transient(exc):
+                raise ProviderUnavailable(str(exc)) from exc
+            raise
+        usage = getattr(response, "usage_metadata", None)
+        return Completion(response.text, getattr(usage, "prompt_token_count", None),
+                          getattr(usage, "candidates_token_count", None))
+
+    def stream(self, prompt: str):
+        try:
+            for chunk in self._model().generate_content(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as exc:
+            if self._transient(exc):
+                raise ProviderUnavailable(str(exc)) from exc
+            raise
+
+    def warm(self):
+        self._client()
+
+    @property
+    def is_warm(self) -> bool:
+        return self._genai is not None
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def _configured_name() -> str:
+    if os.getenv("QUIZ_MODEL") == "fake":
+        return "fake"
+    return os.getenv("QUIZ_PROVIDER", "gemini").lower()
+
+
+def create_provider(name: str) -> QuizProvider:
+    if name == "gemini":
+        return GeminiProvider(os.getenv("GEMINI_MODEL", "gemini-1.5-pro-latest"), os.getenv("API_KEY"))
+    if name == "fake":
+        from service.fake_provider import FakeProvider
+        return FakeProvider()
+    raise ValueError(f"Unknown quiz provider: {name}")
+
+
+def get_provider() -> QuizProvider:
+    """The configured provider, created once per process"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider(_configured_name())
+    return _provider
+
+
+def set_provider(provider: QuizProvider | None):
+    """Replace the process-wide provider, e.g. with a tuned FakeProvider in benchmarks"""
+    global _provider
+    with _provider_lock:
+        _provider = provider
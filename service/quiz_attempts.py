@@ -0,0 +1,245 @@
+"""Quiz attempt grading and write-behind persistence.
+
+Attempts are graded against answer keys cached in memory (quizzes never change
+once written), then buffered and written by a background thread in batches:
+one bulk INSERT for the attempts plus one upsert per aggregate table, with the
+batch pre-aggregated so a hundred attempts on one quiz become a single
+increment. Aggregates therefore lag submissions by at most ATTEMPT_FLUSH_SECONDS.
+A batch that fails because the database is unavailable is retried as a whole; one
+that fails for any other reason is split until the rows that cannot be written are
+isolated, and those are logged and dropped so they do not hold up the others.
+
+Set ATTEMPT_WRITE_BEHIND=false to write every submission before responding.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from cachetools import TTLCache
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from db import bulk, models
+from db.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND = os.getenv("ATTEMPT_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+BATCH_SIZE = int(os.getenv("ATTEMPT_BATCH_SIZE", "500"))
+FLUSH_SECONDS = float(os.getenv("ATTEMPT_FLUSH_SECONDS", "0.5"))
+MAX_BUFFERED = int(os.getenv("ATTEMPT_MAX_BUFFERED", "20000"))
+ANSWER_KEY_CACHE_SIZE = int(os.getenv("ATTEMPT_ANSWER_KEY_CACHE_SIZE", "4096"))
+BUCKETS = 10
+
+_answer_keys = TTLCache(maxsize=ANSWER_KEY_CACHE_SIZE, ttl=3600)
+_buffer = []
+_lock = threading.Lock()
+_wake = threading.Event()
+_stopping = threading.Event()
+_thread = None
+_stats = {"submitted": 0, "written": 0, "batches": 0, "dropped": 0, "rejected": 0, "flush_errors": 0,
+          "dead_lettered": 0}
+
+
+class BufferFull(Exception):
+    """Raised when the write-behind buffer is full, e.g. while the database is down"""
+
+
+def _normalize(answer: str) -> str:
+    return " ".join(answer.split()).casefold()
+
+
+async def answer_key(db: AsyncSession, quiz_id: int):
+    """The quiz's normalized answers in question order, or None if the quiz does not exist"""
+    with _lock:
+        key = _answer_keys.get(quiz_id)
+    if key is None:
+        answers = (await db.scalars(
+            select(models.QuizQuestion.answer)
+            .where(models.QuizQuestion.quiz_id == quiz_id)
+            .order_by(models.QuizQuestion.position)
+        )).all()
+        if not answers:
+            return None
+        key = tuple(_normalize(answer) for answer in answers)
+        with _lock:
+            _answer_keys[quiz_id] = key
+    return key
+
+
+def grade(key, answers) -> list:
+    """Per-question correctness; unanswered questions count as wrong"""
+    return [answer is not None and _normalize(answer) == expected
+            for expected, answer in zip(key, list(answers) + [None] * (len(key) - len(answers)))]
+
+
+def attempt_row(quiz_id: int, user_id: int, answers, results) -> dict:
+    return {"quiz_id": quiz_id, "user_id": user_id, "answers": list(answers), "correct": sum(results),
+            "total": len(results), "results": list(results), "submitted_at": models.utcnow()}
+
+
+def _bucket(correct: int, total: int) -> int:
+    return correct * BUCKETS // total if total else 0
+
+
+def _upsert_increment(db: Session, model, keys, rows, replace=()):
+    """Insert rows, or add their counters to the existing rows with the same keys"""
+    upsert = bulk.dialect_insert(db.bind, model)
+    table = model.__table__
+    columns = [column for column in rows[0] if column not in keys]
+    set_ = {column: upsert.excluded[column] if column in replace else table.c[column] + upsert.excluded[column]
+            for column in columns}
+    # A stable row order keeps concurrent writers from deadlocking on each other's rows
+    rows = sorted(rows, key=lambda row: tuple(row[key] for key in keys))
+    db.execute(upsert.on_conflict_do_update(index_elements=keys, set_=set_), rows)
+
+
+def write(attempts: list):
+    """Persist graded attempts and fold them into the aggregates in one transaction"""
+    with SessionLocal() as db:
+        quiz_ids = {attempt["quiz_id"] for attempt in attempts}
+        existing = set(db.scalars(select(models.Quiz.id).where(models.Quiz.id.in_(quiz_ids))))
+        kept = [attempt for attempt in attempts if attempt["quiz_id"] in existing]
+        _stats["dropped"] += len(attempts) - len(kept)
+        if not kept:
+            return
+
+        quizzes = defaultdict(lambda: [0, 0, 0])
+        buckets = defaultdict(int)
+        questions = defaultdict(lambda: [0, 0])
+        users = {}
+        for attempt in kept:
+            quiz = quizzes[attempt["quiz_id"]]
+            quiz[0] += 1
+            quiz[1] += attempt["correct"]
+            quiz[2] += attempt["total"]
+            buckets[attempt["quiz_id"], _bucket(attempt["correct"], attempt["total"])] += 1
+            for position, (answer, correct) in enumerate(zip(attempt["answers"], attempt["results"])):
+                question = questions[attempt["quiz_id"], position]
+                question[0] += answer is not None
+                question[1] += correct
+            user = users.setdefault(attempt["user_id"], [0, 0, 0, None])
+            user[0] += 1
+            user[1] += attempt["correct"]
+            user[2] += attempt["total"]
+            user[3] = max(filter(None, (user[3], attempt["submitted_at"])))
+
+        db.execute(insert(models.QuizAttempt), [
+            {key: value for key, value in attempt.items() if key != "results"} for attempt in kept
+        ])
+        _upsert_increment(db, models.QuizAttemptStats, ["quiz_id"], [
+            {"quiz_id": quiz_id, "attempts": a, "correct": c, "total": t} for quiz_id, (a, c, t) in quizzes.items()
+        ])
+        _upsert_increment(db, models.QuizScoreBucket, ["quiz_id", "bucket"], [
+            {"quiz_id": quiz_id, "bucket": bucket, "attempts": count} for (quiz_id, bucket), count in buckets.items()
+        ])
+        if questions:
+            _upsert_increment(db, models.QuizQuestionStats, ["quiz_id", "position"], [
+                {"quiz_id": quiz_id, "position": position, "answered": answered, "correct": correct}
+                for (quiz_id, position), (answered, correct) in questions.items()
+            ])
+        _upsert_increment(db, models.UserAttemptStats, ["user_id"], [
+            {"user_id": user_id, "attempts": a, "correct": c, "total": t, "last_attempt_at": last}
+            for user_id, (a, c, t, last) in users.items()
+        ], replace=("last_attempt_at",))
+        db.commit()
+    _stats["written"] += len(kept)
+    _stats["batches"] += 1
+
+
+async def submit(attempts: list):
+    """Queue graded attempts for the writer thread, or write them now without write-behind"""
+    _stats["submitted"] += len(attempts)
+    if not WRITE_BEHIND:
+        await run_in_threadpool(write, attempts)
+        return
+    with _lock:
+        if len(_buffer) + len(attempts) > MAX_BUFFERED:
+            _stats["rejected"] += len(attempts)
+            raise BufferFull()
+        _buffer.extend(attempts)
+        if len(_buffer) >= BATCH_SIZE:
+            _wake.set()
+
+
+def _write_or_split(batch: list) -> list:
+    """Write a batch, bisecting it around rows that cannot be written; returns the rows to retry later"""
+    try:
+        write(batch)
+        return []
+    except (OperationalError, InterfaceError, PoolTimeout):
+        # The database is unreachable or busy: the same rows will go through once it is back
+        logger.exception("Writing %s quiz attempts failed, retrying", len(batch))
+        _stats["flush_errors"] += 1
+        return batch
+    except Exception:
+        _stats["flush_errors"] += 1
+        if len(batch) == 1:
+            logger.exception("Dropping a quiz attempt that cannot be written: %r", batch[0])
+            _stats["dead_lettered"] += 1
+            return []
+    middle = len(batch) // 2
+    retry = _write_or_split(batch[:middle])
+    if retry:
+        return retry + batch[middle:]
+    return _write_or_split(batch[middle:])
+
+
+def _drain():
+    while True:
+        with _lock:
+            batch = _buffer[:BATCH_SIZE]
+            del _buffer[:BATCH_SIZE]
+        if not batch:
+            return
+        retry = _write_or_split(batch)
+        if retry:
+            with _lock:
+                _buffer[:0] = retry
+            return
+
+
+def _writer():
+    while not _stopping.is_set():
+        _wake.wait(FLUSH_SECONDS)
+        _wake.clear()
+        _drain()
+    _drain()
+
+
+def start():
+    global _thread
+    if _thread is not None or not WRITE_BEHIND:
+        return
+    _stopping.clear()
+    _thread = threading.Thread(target=_writer, name="quiz-attempt-writer", daemon=True)
+    _thread.start()
+
+
+def stop():
+    """Write out everything still buffered and stop the writer thread"""
+    global _thread
+    if _thread is None:
+        return
+    _stopping.set()
+    _wake.set()
+    _thread.join(timeout=30)
+    _thread = None
+
+
+def delete_for_quiz(db: Session, quiz_id: int):
+    """Delete a quiz's attempts and aggregates; the caller commits"""
+    for model in (models.QuizAttempt, models.QuizAttemptStats, models.QuizScoreBucket, models.QuizQuestionStats):
+        db.execute(delete(model).where(model.quiz_id == quiz_id))
+    with _lock:
+        _answer_keys.pop(quiz_id, None)
+
+
+def stats():
+    with _lock:
+        return {**_stats, "buffered": len(_buffer), "write_behind": WRITE_BEHIND, "running": _thread is not None,
+                "answer_keys_cached": len(_answer_keys)}
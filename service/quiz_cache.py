@@ -0,0 +1,117 @@
+import hashlib
+import os
+import threading
+
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
+
+from db import bulk, models
+from service import quiz_generator
+
+CACHE_MAX_SIZE = int(os.getenv("QUIZ_CACHE_MAX_SIZE", "1024"))
+CACHE_TTL_SECONDS = int(os.getenv("QUIZ_CACHE_TTL_SECONDS", "3600"))
+
+_stats = {"hits": 0, "db_hits": 0, "misses": 0, "evictions": 0}
+_lock = threading.Lock()
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that counts entries dropped for size or age"""
+
+    def popitem(self):
+        item = super().popitem()
+        _stats["evictions"] += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        _stats["evictions"] += len(expired)
+        return expired
+
+
+_memory = _CountingTTLCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL_SECONDS)
+
+
+def normalize_content(content: str) -> str:
+    return " ".join(content.split())
+
+
+def content_key(content: str, question_count: int = quiz_generator.DEFAULT_QUESTION_COUNT) -> str:
+    """Hash of the normalized lesson content plus the model, prompt version and question count"""
+    raw = (f"{quiz_generator.model_name()}\n{quiz_generator.PROMPT_VERSION}\n{question_count}\n"
+           f"{normalize_content(content)}")
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def content_keys(content: str) -> list:
+    """The keys of the content for every question count a quiz can be generated with"""
+    counts = range(1, max(quiz_generator.MAX_QUESTION_COUNT, quiz_generator.DEFAULT_QUESTION_COUNT) + 1)
+    return [content_key(content, count) for count in counts]
+
+
+def get(db: Session, key: str):
+    with _lock:
+        questions = _memory.get(key)
+        if questions is not None:
+            _stats["hits"] += 1
+            return questions
+
+    entry = db.get(models.QuizCacheEntry, key)
+    with _lock:
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _stats["db_hits"] += 1
+        _memory[key] = entry.questions
+    return entry.questions
+
+
+def get_many(db: Session, keys) -> dict:
+    """Look up several keys at once, using a single query for the database tier"""
+    keys = set(keys)
+    found = {}
+    with _lock:
+        for key in keys:
+            questions = _memory.get(key)
+            if questions is not None:
+                found[key] = questions
+        _stats["hits"] += len(found)
+
+    missing = [key for key in keys if key not in found]
+    if not missing:
+        return found
+    entries = db.query(models.QuizCacheEntry).filter(models.QuizCacheEntry.content_hash.in_(missing)).all()
+    with _lock:
+        for entry in entries:
+            found[entry.content_hash] = entry.questions
+            _memory[entry.content_hash] = entry.questions
+        _stats["db_hits"] += len(entries)
+        _stats["misses"] += len(missing) - len(entries)
+    return found
+
+
+def put(db: Session, key: str, questions):
+    """Store questions in both tiers; the caller commits the session"""
+    # An upsert, so concurrent writers of the same content replace rather than collide
+    upsert = bulk.dialect_insert(db.bind, models.QuizCacheEntry) \
+        .values(content_hash=key, questions=questions, created_at=models.utcnow())
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=["content_hash"],
+        set_={"questions": upsert.excluded.questions, "created_at": upsert.excluded.created_at},
+    ))
+    with _lock:
+        _memory[key] = questions
+
+
+def invalidate(db: Session, *keys: str):
+    """Drop entries from both tiers; the caller commits the session"""
+    db.query(models.QuizCacheEntry).filter(models.QuizCacheEntry.content_hash.in_(keys)) \
+        .delete(synchronize_session=False)
+    with _lock:
+        for key in keys:
+            _memory.pop(key, None)
+
+
+def stats():
+    with _lock:
+        return {**_stats, "size": len(_memory), "max_size": _memory.maxsize, "ttl_seconds": _memory.ttl}
@@ -1,24 +1,69 @@
-import google.generativeai as genai
 import os
+import time
 from dotenv import load_dotenv
 
+from service import admission, metrics, providers
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Get API key
-api_key = os.getenv("API_KEY")
+# Initialize the provider's client (the Gemini SDK) from the app lifespan instead of on first use
+WARM_ON_STARTUP = os.getenv("QUIZ_MODEL_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Bump whenever the prompt below changes so cached quizzes are not reused
+PROMPT_VERSION = "1"
+DEFAULT_QUESTION_COUNT = int(os.getenv("QUIZ_QUESTION_COUNT", "3"))
+MAX_QUESTION_COUNT = 20
+
+TRANSIENT_ERRORS = providers.TRANSIENT_ERRORS
+
+LLM_SECONDS = metrics.Histogram(
+    "llm_request_duration_seconds", "Model call latency, until the last chunk for streams",
+    ("provider", "operation", "outcome"), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_FIRST_CHUNK_SECONDS = metrics.Histogram(
+    "llm_first_chunk_seconds", "Time until a streamed model call yields its first chunk",
+    ("provider",), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30),
+)
+LLM_TOKENS = metrics.Counter(
+    "llm_tokens", "Model tokens, as reported by the provider or estimated from the text length",
+    ("provider", "kind"),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _outcome(exc) -> str:
+    if exc is None:
+        return "ok"
+    return "transient_error" if isinstance(exc, TRANSIENT_ERRORS) else "error"
+
+
+def _count_tokens(provider, prompt: str, text: str, prompt_tokens=None, completion_tokens=None):
+    LLM_TOKENS.inc(provider.name, "prompt", amount=prompt_tokens or estimate_tokens(prompt))
+    LLM_TOKENS.inc(provider.name, "completion", amount=completion_tokens or estimate_tokens(text))
 
-# Configure API key
-genai.configure(api_key=api_key)
 
-def generate_quiz(lesson_content):
-    """Generate a quiz using Gemini AI"""
+def model_name() -> str:
+    return providers.get_provider().model_name
 
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
 
-    prompt = f"""
+def warm():
+    """Load the provider's client ahead of the first generation"""
+    providers.get_provider().warm()
+
+
+def is_warm() -> bool:
+    return providers.get_provider().is_warm
+
+
+def build_prompt(lesson_content, question_count=DEFAULT_QUESTION_COUNT):
+    return f"""
     Generate a quiz in JSON format based on the given lesson content.  
-    The quiz should contain exactly 3 multiple-choice questions.  
+    The quiz should contain exactly {question_count} multiple-choice questions.  
 
     Quiz Format:
     - Each question should have 4 answer choices labeled A, B, C, and D.  
@@ -48,8 +93,47 @@ def generate_quiz(lesson_content):
     3. The output must be valid JSON, directly parsable in Python or JavaScript.  
     """
 
-    response = model.generate_content(prompt)
-    return response.text
+
+def generate_quiz(lesson_content, question_count=DEFAULT_QUESTION_COUNT):
+    """Generate a quiz with the configured provider"""
+
+    provider = providers.get_provider()
+    prompt = build_prompt(lesson_content, question_count)
+    start = time.perf_counter()
+    error = None
+    try:
+        with admission.permit(estimate_tokens(prompt)):
+            completion = provider.generate(prompt)
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - start, provider.name, "generate", _outcome(error))
+    _count_tokens(provider, prompt, completion.text, completion.prompt_tokens, completion.completion_tokens)
+    return completion.text
+
+
+def stream_quiz(lesson_content, question_count=DEFAULT_QUESTION_COUNT):
+    """Yield the model's answer as text chunks while it is being generated"""
+
+    provider = providers.get_provider()
+    prompt = build_prompt(lesson_content, question_count)
+    start = time.perf_counter()
+    error = None
+    chunks = []
+    try:
+        with admission.permit(estimate_tokens(prompt)):
+            for chunk in provider.stream(prompt):
+                if not chunks:
+                    LLM_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, provider.name)
+                chunks.append(chunk)
+                yield chunk
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - start, provider.name, "stream", _outcome(error))
+        _count_tokens(provider, prompt, "".join(chunks))
 
 # lesson_text = "Python is a popular programming language known for its readability and versatility."
 # quiz = generate_quiz(lesson_text)
@@ -0,0 +1,202 @@
+"""Map-reduce quiz generation for long lessons.
+
+Content that fits in one token budget is sent to the model in a single prompt.
+Longer content is split into chunks at paragraph boundaries, candidate questions
+are generated for every chunk in parallel (each chunk cached by its own hash)
+and the candidates are merged, deduplicated and trimmed to the requested count.
+
+Chunk boundaries are content-defined: besides the size budget, a chunk also ends
+after any paragraph whose hash marks it as an anchor. Editing one paragraph then
+only changes the chunk containing it instead of shifting every later boundary,
+so the other chunks are served from the cache.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy.orm import Session
+
+from db import quiz_store
+from db.database import SessionLocal
+from service import admission, quiz_cache, quiz_generator
+
+CHUNK_TOKEN_BUDGET = int(os.getenv("QUIZ_CHUNK_TOKENS", "1500"))
+CHUNK_CONCURRENCY = int(os.getenv("QUIZ_CHUNK_CONCURRENCY", "4"))
+# Minimum candidates requested per chunk. The count per chunk only depends on the requested
+# question count, never on the number of chunks, so adding or removing a chunk does not
+# change the cache key of the others.
+CHUNK_QUESTIONS = int(os.getenv("QUIZ_CHUNK_QUESTIONS", "2"))
+# Ask the chunks for more candidates than needed so duplicates can be dropped
+CANDIDATE_FACTOR = 1.5
+# Roughly 1 in 4 paragraphs is an anchor, once the chunk has reached a quarter of the budget
+_ANCHOR_MODULUS = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+estimate_tokens = quiz_generator.estimate_tokens
+
+
+def _split_oversized(paragraph: str, budget: int):
+    """Split a paragraph larger than the budget at sentence, then word boundaries"""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END.split(paragraph):
+        if estimate_tokens(sentence) > budget:
+            words = sentence.split()
+            step = max(1, budget * 4 // 6)
+            sentences = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            sentences = [sentence]
+        for part in sentences:
+            candidate = f"{current} {part}".strip()
+            if current and estimate_tokens(candidate) > budget:
+                pieces.append(current)
+                current = part
+            else:
+                current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _is_anchor(paragraph: str) -> bool:
+    digest = hashlib.sha256(quiz_cache.normalize_content(paragraph).encode("utf-8")).digest()
+    return digest[0] % _ANCHOR_MODULUS == 0
+
+
+def split_content(content: str, budget: int = CHUNK_TOKEN_BUDGET):
+    """Split lesson content into chunks of at most `budget` estimated tokens"""
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) > budget:
+            paragraphs.extend(_split_oversized(paragraph, budget))
+        else:
+            paragraphs.append(paragraph)
+
+    chunks = []
+    current = []
+    size = 0
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph)
+        if current and size + tokens > budget:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += tokens
+        if size >= budget // 4 and _is_anchor(paragraph):
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks or [content]
+
+
+def _parse(text: str):
+    """Parse and validate one model response"""
+    return quiz_store.validate_questions(json.loads(text))
+
+
+def _question_key(question: dict) -> str:
+    return re.sub(r"[\W_]+", " ", question.get("question", "")).strip().lower()
+
+
+def merge_questions(candidates_per_chunk, question_count: int):
+    """Deduplicate candidates by question text and pick them round-robin across chunks"""
+    if not candidates_per_chunk:
+        return []
+    seen = set()
+    unique_per_chunk = []
+    for candidates in candidates_per_chunk:
+        unique = []
+        for question in candidates:
+            key = _question_key(question)
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(question)
+        unique_per_chunk.append(unique)
+
+    # Visit evenly spaced chunks first so the questions cover the whole lesson
+    spread = min(len(unique_per_chunk), question_count)
+    order = list(dict.fromkeys(
+        [j * len(unique_per_chunk) // spread for j in range(spread)] + list(range(len(unique_per_chunk)))
+    ))
+
+    selected = []
+    round_index = 0
+    while len(selected) < question_count and any(round_index < len(q) for q in unique_per_chunk):
+        for index in order:
+            unique = unique_per_chunk[index]
+            if round_index < len(unique) and len(selected) < question_count:
+                selected.append(unique[round_index])
+        round_index += 1
+    return selected
+
+
+def _generate_chunks(chunks, per_chunk: int, force_regenerate: bool):
+    keys = [quiz_cache.content_key(chunk, per_chunk) for chunk in chunks]
+    with SessionLocal() as db:
+        cached = {} if force_regenerate else quiz_cache.get_many(db, keys)
+
+    to_generate = {key: chunk for key, chunk in zip(keys, chunks) if key not in cached}
+    if to_generate:
+        def generate(chunk):
+            return _parse(quiz_generator.generate_quiz(chunk, per_chunk))
+
+        # The chunks are one fan-out: wait for the buckets to admit all of them rather than
+        # failing on every chunk beyond the burst
+        wait_seconds = admission.batch_wait_seconds(
+            len(to_generate), sum(estimate_tokens(chunk) for chunk in to_generate.values()))
+        generate = admission.bind_caller(generate, wait_seconds)
+        error = None
+        with ThreadPoolExecutor(max_workers=max(1, CHUNK_CONCURRENCY), thread_name_prefix="quiz-chunk") as executor:
+            futures = {executor.submit(generate, chunk): key for key, chunk in to_generate.items()}
+            # Cache every chunk as soon as it is done, so a failed chunk does not throw away the
+            # others and a retry only pays for the chunks still missing
+            for future in as_completed(futures):
+                try:
+                    questions = future.result()
+                except Exception as exc:
+                    error = error or exc
+                    continue
+                with SessionLocal() as db:
+                    quiz_cache.put(db, futures[future], questions)
+                    db.commit()
+                cached[futures[future]] = questions
+        if error is not None:
+            raise error
+    return [cached[key] for key in keys]
+
+
+def generate_questions(content: str, question_count: int = quiz_generator.DEFAULT_QUESTION_COUNT,
+                       force_regenerate: bool = False):
+    """Generate `question_count` questions for the content, chunking it if it is too long"""
+    chunks = split_content(content)
+    if len(chunks) == 1:
+        return _parse(quiz_generator.generate_quiz(content, question_count))
+
+    # Content that is chunked has at least two chunks, which is enough candidates for any count
+    per_chunk = max(CHUNK_QUESTIONS, math.ceil(question_count * CANDIDATE_FACTOR / 2))
+    return merge_questions(_generate_chunks(chunks, per_chunk, force_regenerate), question_count)
+
+
+def get_or_generate(db: Session, content: str, question_count: int = quiz_generator.DEFAULT_QUESTION_COUNT,
+                    force_regenerate: bool = False):
+    """Return (content_hash, questions), calling the model only on a cache miss"""
+    key = quiz_cache.content_key(content, question_count)
+    if not force_regenerate:
+        questions = quiz_cache.get(db, key)
+        if questions is not None:
+            return key, questions
+        # Do not hold a pooled connection for the duration of the model call
+        db.commit()
+
+    questions = generate_questions(content, question_count, force_regenerate)
+    quiz_cache.put(db, key, questions)
+    return key, questions
@@ -0,0 +1,239 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from db import models, quiz_store, schemas
+from db.database import SessionLocal
+from service import admission, http_cache, quiz_cache, quiz_generator, quiz_pipeline, single_flight
+from service.json_stream import JsonArrayParser
+
+BULK_CONCURRENCY = min(int(os.getenv("QUIZ_BULK_CONCURRENCY", "8")), admission.MAX_CONCURRENT_PER_CALLER)
+DEFAULT_QUESTION_COUNT = quiz_generator.DEFAULT_QUESTION_COUNT
+MAX_QUESTION_COUNT = quiz_generator.MAX_QUESTION_COUNT
+
+
+def _latest_quiz_id(db: Session, lesson_id: int, content_hash: str):
+    return db.query(func.max(models.Quiz.id)) \
+        .filter(models.Quiz.lesson_id == lesson_id, models.Quiz.content_hash == content_hash) \
+        .scalar()
+
+
+def _save_quiz(db: Session, lesson_id: int, content_hash: str, questions) -> int:
+    quiz_id = quiz_store.add_quiz(db, lesson_id, content_hash, questions)
+    db.commit()
+    http_cache.invalidate(http_cache.lesson_key(lesson_id))
+    return quiz_id
+
+
+def _generate_and_store(lesson_id: int, content: str, question_count: int, force_regenerate: bool) -> int:
+    with SessionLocal() as db:
+        content_hash, questions = quiz_pipeline.get_or_generate(db, content, question_count, force_regenerate)
+        return _save_quiz(db, lesson_id, content_hash, questions)
+
+
+def _lookup_quiz_id(lesson_id: int, content_hash: str):
+    with SessionLocal() as db:
+        return _latest_quiz_id(db, lesson_id, content_hash)
+
+
+def create_lesson_quiz(db: Session, lesson: models.Lesson, force_regenerate: bool = False,
+                       question_count: int = DEFAULT_QUESTION_COUNT) -> models.Quiz:
+    """Return the lesson's quiz for its current content, generating it if needed.
+
+    Concurrent calls for the same lesson and content share one model call and one quiz row.
+    `force_regenerate` always produces a fresh quiz.
+    """
+    content_hash = quiz_cache.content_key(lesson.content, question_count)
+    if not force_regenerate:
+        quiz_id = _latest_quiz_id(db, lesson.id, content_hash)
+        if quiz_id is not None:
+            return db.get(models.Quiz, quiz_id)
+
+    lesson_id, content = lesson.id, lesson.content
+    # Give the connection back to the pool while the model runs or another worker's result is awaited
+    db.commit()
+    quiz_id = single_flight.run(
+        f"quiz:{lesson_id}:{content_hash}:{int(force_regenerate)}",
+        produce=lambda: _generate_and_store(lesson_id, content, question_count, force_regenerate),
+        lookup=None if force_regenerate else lambda: _lookup_quiz_id(lesson_id, content_hash),
+    )
+    return db.get(models.Quiz, quiz_id)
+
+
+def _stored_quiz(lesson_id: int, content_hash: str):
+    """(quiz id, questions) of the quiz stored for this content, saving cached questions as one; None if neither"""
+    with SessionLocal() as db:
+        quiz_id = _latest_quiz_id(db, lesson_id, content_hash)
+        if quiz_id is not None:
+            return quiz_id, db.get(models.Quiz, quiz_id).questions
+        questions = quiz_cache.get(db, content_hash)
+        if questions is not None:
+            return _save_quiz(db, lesson_id, content_hash, questions), questions
+    return None
+
+
+def _replay(quiz_id: int, questions):
+    for question in questions:
+        yield "question", question
+    yield "done", {"quiz_id": quiz_id}
+
+
+def _stream_new_quiz(lesson_id: int, content: str, content_hash: str, question_count: int, force_regenerate: bool):
+    """Yield the questions of a new quiz as the model completes them, then persist it and return its id"""
+    if len(quiz_pipeline.split_content(content)) > 1:
+        questions = quiz_pipeline.generate_questions(content, question_count, force_regenerate)
+        for question in questions:
+            yield "question", question
+    else:
+        parser = JsonArrayParser()
+        questions = []
+        for chunk in quiz_generator.stream_quiz(content, question_count):
+            for item in parser.feed(chunk):
+                question = schemas.Question.model_validate(item).model_dump()
+                questions.append(question)
+                yield "question", question
+        if not parser.finished:
+            raise ValueError("Model returned an incomplete JSON array")
+
+    with SessionLocal() as db:
+        quiz_cache.put(db, content_hash, questions)
+        return _save_quiz(db, lesson_id, content_hash, questions)
+
+
+def stream_lesson_quiz(lesson_id: int, content: str, force_regenerate: bool = False,
+                       question_count: int = DEFAULT_QUESTION_COUNT):
+    """Yield ("question", question) events as soon as each question is complete, then ("done", quiz_id).
+
+    Stored or cached questions are replayed immediately; otherwise the model output is
+    parsed incrementally and the whole quiz is persisted once the stream ends. Long
+    lessons go through the chunked pipeline and are sent once it has merged the chunks.
+    Concurrent requests for the same content share one generation, as in `create_lesson_quiz`:
+    followers wait for the leader's quiz and replay it.
+    """
+    content_hash = quiz_cache.content_key(content, question_count)
+    if force_regenerate:
+        quiz_id = yield from _stream_new_quiz(lesson_id, content, content_hash, question_count, True)
+        yield "done", {"quiz_id": quiz_id}
+        return
+
+    stored = _stored_quiz(lesson_id, content_hash)
+    if stored is None:
+        with single_flight.lead(f"quiz:{lesson_id}:{content_hash}:0",
+                                lookup=lambda: _lookup_quiz_id(lesson_id, content_hash)) as flight:
+            leading = flight.result is None
+            if leading:
+                flight.result = yield from _stream_new_quiz(lesson_id, content, content_hash, question_count, False)
+        if leading:
+            yield "done", {"quiz_id": flight.result}
+            return
+        with SessionLocal() as db:
+            stored = flight.result, db.get(models.Quiz, flight.result).questions
+    yield from _replay(*stored)
+
+
+async def _generate_questions(content: str, question_count: int, force_regenerate: bool,
+                              executor: ThreadPoolExecutor, wait_seconds: float):
+    loop = asyncio.get_running_loop()
+    generate = admission.bind_caller(quiz_pipeline.generate_questions, wait_seconds)
+    return await loop.run_in_executor(executor, generate, content, question_count, force_regenerate)
+
+
+def _plan_course(course_id: int, force_regenerate: bool, question_count: int):
+    """Load the course's lessons, their existing quizzes and cached questions; None if the course does not exist"""
+    with SessionLocal() as db:
+        if db.get(models.Course, course_id) is None:
+            return None
+        lessons = db.query(models.Lesson.id, models.Lesson.content) \
+            .filter(models.Lesson.course_id == course_id).order_by(models.Lesson.id).all()
+        keys = {lesson.id: quiz_cache.content_key(lesson.content, question_count) for lesson in lessons}
+        existing = {}
+        if not force_regenerate and keys:
+            rows = db.query(models.Quiz.lesson_id, models.Quiz.content_hash, func.max(models.Quiz.id)) \
+                .filter(models.Quiz.lesson_id.in_(keys), models.Quiz.content_hash.in_(set(keys.values()))) \
+                .group_by(models.Quiz.lesson_id, models.Quiz.content_hash) \
+                .all()
+            existing = {lesson_id: quiz_id for lesson_id, content_hash, quiz_id in rows
+                        if keys[lesson_id] == content_hash}
+        pending = [lesson for lesson in lessons if lesson.id not in existing]
+        cached = {} if force_regenerate else quiz_cache.get_many(db, [keys[lesson.id] for lesson in pending])
+    return lessons, keys, existing, pending, cached
+
+
+def _store_course_quizzes(generated: dict, rows: list) -> list:
+    with SessionLocal() as db:
+        for key, questions in generated.items():
+            quiz_cache.put(db, key, questions)
+        quiz_ids = quiz_store.add_quizzes(db, rows) if rows else []
+        db.commit()
+    http_cache.invalidate(*(http_cache.lesson_key(row["lesson_id"]) for row in rows))
+    return quiz_ids
+
+
+async def create_course_quizzes(course_id: int, concurrency: int = BULK_CONCURRENCY,
+                                force_regenerate: bool = False, question_count: int = DEFAULT_QUESTION_COUNT):
+    """Generate quizzes for every lesson of a course; None if the course does not exist.
+
+    Lessons whose latest content already has a quiz are skipped, cached questions are reused,
+    the remaining model calls run concurrently (at most `concurrency` at a time) and all new
+    quizzes are written with one bulk insert. Returns one outcome dict per lesson.
+
+    Database work runs on the threadpool in short sessions, so no connection is held and
+    the event loop never waits on the pool while the model calls run.
+
+    `concurrency` is capped at LLM_MAX_CONCURRENT_PER_CALLER: admission would hold any
+    calls beyond it anyway, so more threads would only wait.
+    """
+    concurrency = min(concurrency, admission.MAX_CONCURRENT_PER_CALLER)
+    plan = await run_in_threadpool(_plan_course, course_id, force_regenerate, question_count)
+    if plan is None:
+        return None
+    lessons, keys, existing, pending, cached = plan
+    outcomes = {lesson.id: {"lesson_id": lesson.id, "status": None, "quiz_id": None, "error": None}
+                for lesson in lessons}
+    for lesson_id, quiz_id in existing.items():
+        outcomes[lesson_id].update(status="skipped", quiz_id=quiz_id)
+
+    # Lessons with identical content share one model call
+    to_generate = {}
+    for lesson in pending:
+        if keys[lesson.id] not in cached:
+            to_generate.setdefault(keys[lesson.id], lesson.content)
+
+    # A bulk run queues for model capacity like a background job instead of failing fast, long
+    # enough for the rate limits to admit every model call of the batch
+    wait_seconds = admission.batch_wait_seconds(
+        sum(len(quiz_pipeline.split_content(content)) for content in to_generate.values()),
+        sum(quiz_pipeline.estimate_tokens(content) for content in to_generate.values()),
+    )
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="quiz-bulk") as executor:
+        results = await asyncio.gather(
+            *(_generate_questions(content, question_count, force_regenerate, executor, wait_seconds)
+              for content in to_generate.values()),
+            return_exceptions=True,
+        )
+    generated = {}
+    errors = {}
+    for key, result in zip(to_generate, results):
+        if isinstance(result, Exception):
+            errors[key] = str(result) or type(result).__name__
+        else:
+            generated[key] = result
+
+    rows = []
+    for lesson in pending:
+        key = keys[lesson.id]
+        if key in errors:
+            outcomes[lesson.id].update(status="failed", error=errors[key])
+            continue
+        outcomes[lesson.id]["status"] = "generated" if key in generated else "cached"
+        rows.append({"lesson_id": lesson.id, "questions": generated.get(key) or cached[key], "content_hash": key})
+
+    quiz_ids = await run_in_threadpool(_store_course_quizzes, generated, rows)
+    for row, quiz_id in zip(rows, quiz_ids):
+        outcomes[row["lesson_id"]]["quiz_id"] = quiz_id
+
+    return [outcomes[lesson.id] for lesson in lessons]
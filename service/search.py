@@ -0,0 +1,128 @@
+"""Ranked full-text search over courses and lessons.
+
+Postgres uses the weighted `search_vector` tsvector columns (generated, GIN
+indexed); SQLite uses the `courses_fts` / `lessons_fts` FTS5 tables kept in sync
+by triggers. Both are created by migration 0005. Matches are ranked and paged in
+the database, and snippets are only built for the rows of the returned page.
+
+Scoring is the expensive part, so each table scores at most SEARCH_MAX_CANDIDATES
+matches, the newest ones (highest ids, read straight off the index in reverse),
+and contributes them ranked by bm25 / `ts_rank`. Ranking is exact for terms with
+fewer matches than that; a common term is ranked over its newest matches, which
+keeps its cost bounded no matter how many rows contain it. The search route does
+not page past SEARCH_MAX_CANDIDATES results and reports the cut instead.
+"""
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "2000"))
+KINDS = ("course", "lesson")
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_WORDS = 16
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# One candidate more than the window, so the route can tell whether matches were cut off.
+# The LIMIT sits in the inner query, before anything is scored.
+_POSTGRES_HITS = {
+    "lesson": "SELECT 'lesson' AS kind, id, ts_rank(search_vector, q.query) AS score FROM q, "
+              "(SELECT id, search_vector FROM lessons, q WHERE search_vector @@ q.query "
+              "ORDER BY id DESC LIMIT :candidates + 1) l",
+    "course": "SELECT 'course' AS kind, id, ts_rank(search_vector, q.query) AS score FROM q, "
+              "(SELECT id, search_vector FROM courses, q WHERE search_vector @@ q.query "
+              "ORDER BY id DESC LIMIT :candidates + 1) c",
+}
+
+_POSTGRES_PAGE = """
+WITH q AS (SELECT websearch_to_tsquery('english', :q) AS query),
+hits AS (
+    {hits}
+    ORDER BY score DESC, kind, id
+    LIMIT :limit OFFSET :offset
+)
+SELECT hits.kind, hits.id, coalesce(l.title, c.title) AS title, l.course_id,
+       ts_headline('english', coalesce(l.content, c.description, ''), q.query, :headline) AS snippet,
+       hits.score
+FROM hits
+CROSS JOIN q
+LEFT JOIN lessons l ON hits.kind = 'lesson' AND l.id = hits.id
+LEFT JOIN courses c ON hits.kind = 'course' AND c.id = hits.id
+ORDER BY hits.score DESC, hits.kind, hits.id
+"""
+
+# `rank` is bm25() with the title weighted 4x; it is lower-is-better, so it is negated for
+# both backends to rank by descending score. FTS5 computes it only for the rows the
+# rowid-ordered, limited scan returns.
+_SQLITE_HITS = {
+    "lesson": "SELECT * FROM (SELECT 'lesson' AS kind, rowid AS id, -rank AS score FROM lessons_fts "
+              "WHERE lessons_fts MATCH :q AND rank MATCH 'bm25(4.0, 1.0)' ORDER BY rowid DESC LIMIT :candidates + 1)",
+    "course": "SELECT * FROM (SELECT 'course' AS kind, rowid AS id, -rank AS score FROM courses_fts "
+              "WHERE courses_fts MATCH :q AND rank MATCH 'bm25(4.0, 1.0)' ORDER BY rowid DESC LIMIT :candidates + 1)",
+}
+
+_SQLITE_PAGE = "{hits} ORDER BY score DESC, kind, id LIMIT :limit OFFSET :offset"
+
+_SQLITE_DETAILS = {
+    "lesson": "SELECT l.id, l.title, l.course_id, snippet(lessons_fts, -1, :start, :end, '…', :words) "
+              "FROM lessons_fts JOIN lessons l ON l.id = lessons_fts.rowid "
+              "WHERE lessons_fts MATCH :q AND lessons_fts.rowid IN ({ids})",
+    "course": "SELECT c.id, c.title, NULL, snippet(courses_fts, -1, :start, :end, '…', :words) "
+              "FROM courses_fts JOIN courses c ON c.id = courses_fts.rowid "
+              "WHERE courses_fts MATCH :q AND courses_fts.rowid IN ({ids})",
+}
+
+
+def fts5_query(query: str) -> str:
+    """Turn free text into an FTS5 query matching all of its words, immune to FTS5 syntax"""
+    return " ".join(f'"{word}"' for word in _WORD.findall(query))
+
+
+def _result(kind, id, title, course_id, snippet, score):
+    return {"type": kind, "id": id, "title": title, "course_id": course_id, "snippet": snippet,
+            "score": float(score)}
+
+
+async def _search_postgres(db: AsyncSession, query: str, kinds, limit: int, offset: int):
+    headline = (f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords={SNIPPET_WORDS}, "
+                f"MinWords={SNIPPET_WORDS // 3}, MaxFragments=1")
+    statement = _POSTGRES_PAGE.format(hits=" UNION ALL ".join(_POSTGRES_HITS[kind] for kind in kinds))
+    rows = await db.execute(text(statement), {"q": query, "limit": limit, "offset": offset, "headline": headline,
+                                              "candidates": MAX_CANDIDATES})
+    return [_result(*row) for row in rows]
+
+
+async def _search_sqlite(db: AsyncSession, query: str, kinds, limit: int, offset: int):
+    match = fts5_query(query)
+    if not match:
+        return []
+    statement = _SQLITE_PAGE.format(hits=" UNION ALL ".join(_SQLITE_HITS[kind] for kind in kinds))
+    hits = (await db.execute(
+        text(statement), {"q": match, "limit": limit, "offset": offset, "candidates": MAX_CANDIDATES}
+    )).all()
+
+    details = {}
+    for kind in kinds:
+        ids = [id for hit_kind, id, _ in hits if hit_kind == kind]
+        if not ids:
+            continue
+        rows = await db.execute(
+            text(_SQLITE_DETAILS[kind].format(ids=", ".join(str(int(id)) for id in ids))),
+            {"q": match, "start": SNIPPET_START, "end": SNIPPET_END, "words": SNIPPET_WORDS},
+        )
+        for id, title, course_id, snippet in rows:
+            details[kind, id] = (title, course_id, snippet)
+    return [_result(kind, id, *details[kind, id], score) for kind, id, score in hits if (kind, id) in details]
+
+
+async def search(db: AsyncSession, query: str, kinds=KINDS, limit: int = 20, offset: int = 0):
+    """Return one page of ranked matches, best first"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return await _search_postgres(db, query, kinds, limit, offset)
+    if dialect == "sqlite":
+        return await _search_sqlite(db, query, kinds, limit, offset)
+    raise NotImplementedError(f"Full-text search is not supported on {dialect}")
@@ -0,0 +1,165 @@
+"""Coalesce concurrent calls for the same key into a single execution.
+
+Within a process, followers wait on the leader's in-flight call. Across uvicorn
+workers, the leader holds a row in `generation_leases` while it runs and
+followers in other processes poll `lookup` until the leader's result shows up,
+taking over the lease if the leader dies and it expires.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from db import models
+from db.database import engine
+
+FLIGHT_TIMEOUT_SECONDS = float(os.getenv("QUIZ_SINGLE_FLIGHT_TIMEOUT_SECONDS", "120"))
+LEASE_SECONDS = float(os.getenv("QUIZ_SINGLE_FLIGHT_LEASE_SECONDS", "180"))
+POLL_SECONDS = float(os.getenv("QUIZ_SINGLE_FLIGHT_POLL_SECONDS", "0.25"))
+
+_OWNER_PREFIX = f"{socket.gethostname()}:{os.getpid()}"
+
+_stats = {"leaders": 0, "coalesced_local": 0, "coalesced_remote": 0, "timeouts": 0}
+_lock = threading.Lock()
+_inflight = {}
+
+
+def new_owner() -> str:
+    """A lease owner id unique to one call, prefixed with this host and process"""
+    return f"{_OWNER_PREFIX}:{uuid.uuid4().hex}"
+
+
+class FlightTimeout(Exception):
+    """Raised when a follower gives up waiting for the leader's result"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _acquire_lease(key: str, owner: str) -> bool:
+    now = models.utcnow()
+    expires_at = now + timedelta(seconds=LEASE_SECONDS)
+    table = models.GenerationLease.__table__
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(table).values(key=key, owner=owner, expires_at=expires_at))
+        return True
+    except IntegrityError:
+        pass
+    # The lease exists; take it over only if its holder let it expire
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(table)
+            .where(table.c.key == key, table.c.expires_at < now)
+            .values(owner=owner, expires_at=expires_at)
+        )
+    return result.rowcount == 1
+
+
+def _release_lease(key: str, owner: str):
+    table = models.GenerationLease.__table__
+    with engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.key == key, table.c.owner == owner))
+
+
+def _wait_for_lease(key: str, owner: str, lookup, timeout: float):
+    """Take the lease for `key` and return None, or return the result another worker stored meanwhile"""
+    deadline = time.monotonic() + timeout
+    waited = False
+    while True:
+        if _acquire_lease(key, owner):
+            # Another worker may have finished while we were waiting for the lease
+            result = lookup() if lookup else None
+            if result is not None:
+                _release_lease(key, owner)
+            return result
+
+        if not waited:
+            waited = True
+            with _lock:
+                _stats["coalesced_remote"] += 1
+        if time.monotonic() >= deadline:
+            with _lock:
+                _stats["timeouts"] += 1
+            raise FlightTimeout(key)
+        time.sleep(POLL_SECONDS)
+        result = lookup() if lookup else None
+        if result is not None:
+            return result
+
+
+@contextmanager
+def lead(key: str, lookup=None, timeout: float = FLIGHT_TIMEOUT_SECONDS):
+    """`run` for callers that produce the result themselves, e.g. while streaming it.
+
+    Yields a call whose `result` is already set when a concurrent caller produced it;
+    otherwise this caller leads and sets `result` before leaving the block. Followers
+    of a leader that leaves without a result (say, a closed stream) try to lead in turn.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with _lock:
+            call = _inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _inflight[key] = _Call()
+            else:
+                _stats["coalesced_local"] += 1
+        if leader:
+            break
+        if not call.done.wait(max(deadline - time.monotonic(), 0)):
+            with _lock:
+                _stats["timeouts"] += 1
+            raise FlightTimeout(key)
+        if call.error is not None:
+            raise call.error
+        if call.result is not None:
+            yield call
+            return
+
+    owner = new_owner()
+    try:
+        call.result = _wait_for_lease(key, owner, lookup, max(deadline - time.monotonic(), 0))
+        if call.result is not None:
+            yield call
+            return
+        with _lock:
+            _stats["leaders"] += 1
+        try:
+            yield call
+        finally:
+            _release_lease(key, owner)
+    except Exception as exc:
+        call.error = exc
+        raise
+    finally:
+        with _lock:
+            del _inflight[key]
+        call.done.set()
+
+
+def run(key: str, produce, lookup=None, timeout: float = FLIGHT_TIMEOUT_SECONDS):
+    """Return `produce()` for `key`, sharing one execution between concurrent callers.
+
+    `lookup` returns the already persisted result (or None); it lets followers in other
+    processes pick up what the leader stored.
+    """
+    with lead(key, lookup, timeout) as call:
+        if call.result is None:
+            call.result = produce()
+        return call.result
+
+
+def stats():
+    with _lock:
+        return {**_stats, "in_flight": len(_inflight)}